@@ -0,0 +1,199 @@
+'''
+    Acumuladores de métricas atualizados a cada passo da simulação
+'''
+
+from typing import Dict, List
+
+import numpy as np
+from portfolio import Portfolio
+
+PREGOES_POR_ANO = 252
+
+
+class Step:
+    """
+    Estado de um pregão da simulação, repassado aos acumuladores.
+
+    :ivar date: Data do pregão (YYYY-MM-DD).
+    :ivar balance: Caixa ao fim do pregão.
+    :ivar equity: Caixa + carteira a preço de mercado (última cotação conhecida de cada ativo).
+    :ivar portfolio: Carteira ao fim do pregão.
+    :ivar prices: Última cotação conhecida de cada ativo, alinhada com `MemData.symbol_index`.
+    :ivar buys: Compras do pregão (registros do log de compras).
+    :ivar sells: Vendas do pregão (registros do log de vendas).
+    """
+    __slots__ = ('date', 'balance', 'equity', 'portfolio', 'prices', 'buys', 'sells')
+
+    def __init__(self, date: str, balance: float, equity: float, portfolio: Portfolio,
+                 prices: np.ndarray, buys: List[Dict], sells: List[Dict]):
+        self.date = date
+        self.balance = balance
+        self.equity = equity
+        self.portfolio = portfolio
+        self.prices = prices
+        self.buys = buys
+        self.sells = sells
+
+
+class Accumulator:
+    """
+    Métrica calculada durante a simulação, em O(1) por pregão em relação ao tamanho
+    do histórico, sem precisar da timeline.
+    """
+
+    def start(self, capital: float) -> None:
+        """
+        Reinicia o acumulador no início de uma simulação.
+
+        :param capital: Capital inicial.
+        """
+
+    def update(self, step: Step) -> None:
+        """
+        Atualiza o acumulador com o estado ao fim de um pregão.
+
+        :param step: Estado do pregão.
+        """
+
+    def result(self) -> Dict:
+        """
+        Retorna as métricas acumuladas.
+
+        :return: Dicionário com o nome e o valor de cada métrica.
+        """
+        return {}
+
+
+class EquityAccumulator(Accumulator):
+    """Patrimônio a preço de mercado, pico e maior queda a partir do pico."""
+
+    def start(self, capital: float) -> None:
+        self.capital = capital
+        self.equity = capital
+        self.peak = capital
+        self.max_drawdown = 0.0
+
+    def update(self, step: Step) -> None:
+        self.equity = step.equity
+        self.peak = max(self.peak, step.equity)
+        self.max_drawdown = max(self.max_drawdown, 1 - step.equity / self.peak)
+
+    def result(self) -> Dict:
+        return {
+            'patrimonio_final': float(self.equity),
+            'retorno_mtm': float(self.equity / self.capital - 1),
+            'max_drawdown': float(self.max_drawdown),
+        }
+
+
+class ReturnMoments(Accumulator):
+    """Média e variância dos retornos diários (algoritmo de Welford), volatilidade e Sharpe."""
+
+    def start(self, capital: float) -> None:
+        self.previous = capital
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, step: Step) -> None:
+        retorno = step.equity / self.previous - 1
+        self.previous = step.equity
+
+        self.count += 1
+        delta = retorno - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (retorno - self.mean)
+
+    def result(self) -> Dict:
+        volatilidade = 0.0
+        sharpe = float('nan')
+        if self.count > 1:
+            desvio = np.sqrt(self.m2 / (self.count - 1))
+            volatilidade = float(desvio * np.sqrt(PREGOES_POR_ANO))
+            if desvio > 0:
+                sharpe = float(self.mean / desvio * np.sqrt(PREGOES_POR_ANO))
+        return {
+            'retorno_medio_diario': float(self.mean),
+            'volatilidade': volatilidade,
+            'sharpe': sharpe,
+        }
+
+
+class TradeCounter(Accumulator):
+    """
+    Quantidade de compras e vendas, volume negociado, turnover (volume negociado /
+    patrimônio médio, contando compras e vendas pela metade), lucro realizado e taxa de acerto.
+    """
+
+    def start(self, capital: float) -> None:
+        self.soma_patrimonio = capital
+        self.pontos = 1
+        self.compras = 0
+        self.vendas = 0
+        self.vendas_com_lucro = 0
+        self.valor_comprado = 0.0
+        self.valor_vendido = 0.0
+        self.lucro_realizado = 0.0
+
+    def update(self, step: Step) -> None:
+        self.soma_patrimonio += step.equity
+        self.pontos += 1
+        self.compras += len(step.buys)
+        self.vendas += len(step.sells)
+        for compra in step.buys:
+            self.valor_comprado += compra['quantidade'] * compra['preco_compra']
+        for venda in step.sells:
+            self.valor_vendido += venda['quantidade_vendida'] * venda['preco_venda']
+            self.lucro_realizado += venda['lucro_prejuizo']
+            self.vendas_com_lucro += int(venda['lucro_prejuizo'] > 0)
+
+    def result(self) -> Dict:
+        return {
+            'n_compras': self.compras,
+            'n_vendas': self.vendas,
+            'valor_comprado': float(self.valor_comprado),
+            'valor_vendido': float(self.valor_vendido),
+            'turnover': float((self.valor_comprado + self.valor_vendido) / 2 /
+                              (self.soma_patrimonio / self.pontos)),
+            'lucro_realizado': float(self.lucro_realizado),
+            'taxa_acerto': self.vendas_com_lucro / self.vendas if self.vendas else float('nan'),
+        }
+
+
+class SectorExposure(Accumulator):
+    """Fração média do patrimônio, a preço de mercado, investida em cada setor."""
+
+    def start(self, capital: float) -> None:
+        self.sectors: List[str] = []
+        self.total = np.zeros(0)
+        self.count = 0
+
+    def update(self, step: Step) -> None:
+        carteira = step.portfolio
+        n = carteira.size
+        valores = np.bincount(
+            carteira.sector_ids[:n],
+            weights=carteira.quantities[:n] * step.prices[carteira.symbol_ids[:n]],
+            minlength=len(carteira.sectors))
+
+        if len(valores) > len(self.total):
+            self.total = np.concatenate((self.total, np.zeros(len(valores) - len(self.total))))
+            self.sectors = list(carteira.sectors)
+        if step.equity > 0:
+            self.total[:len(valores)] += valores / step.equity
+        self.count += 1
+
+    def result(self) -> Dict:
+        if self.count == 0:
+            return {'exposicao_setores': {}}
+        return {
+            'exposicao_setores': {
+                setor: float(total / self.count)
+                for setor, total in zip(self.sectors, self.total) if total > 0
+            }
+        }
+
+
+def default_accumulators() -> List[Accumulator]:
+    """Retorna uma instância de cada acumulador disponível."""
+    return [EquityAccumulator(), ReturnMoments(), TradeCounter(), SectorExposure()]
@@ -2,26 +2,61 @@
 B3 module
 '''
 
+from contextlib import nullcontext
 from datetime import datetime
-from typing import List
-import tempfile
+from os import replace
+from os.path import isfile
+from typing import Dict, Iterator, List, Tuple
+import threading
 import time
 import zipfile
+import numpy as np
 import pandas as pd
-import requests
-import yfinance as yf
-from tqdm import tqdm
-from files import open_json, save_dataframe, save_json
+from downloader import BAD_SYMBOL_ERRORS, DownloadReport, Downloader
+from files import (file_path, open_arrays, open_dataframe, open_json, save_arrays,
+                   save_dataframe, save_json)
 
 
 SUB_DIR_HIST = "historical"
+SUB_DIR_B3_HIST = "b3_historical"
 TIMEOUT = 1
 
-URL_QUOTE = 'https://bvmf.bmfbovespa.com.br/InstDados/SerHist/COTAHIST_M'
+URL_QUOTE = 'https://bvmf.bmfbovespa.com.br/InstDados/SerHist/'
+MAX_ATTEMPTS = 10
+CHUNK_RECORDS = 100_000
 
 SUB_DIR_B3 = 'b3'
+SUB_DIR_B3_ARCHIVES = 'b3_archives'
 
 RECENT_ASSETS_FILE = 'recent_assets.json'
+INFO_FILE = 'info_b3.csv'
+INFO_FIELDS = ['sector', 'industry']
+
+# COTAHIST record layout (1-based, inclusive positions)
+COTAHIST_FIELDS = {
+    'TIPREG': (1, 2),
+    'DATPRE': (3, 10),
+    'CODBDI': (11, 12),
+    'CODNEG': (13, 24),
+    'TPMERC': (25, 27),
+    'PREABE': (57, 69),
+    'PREMAX': (70, 82),
+    'PREMIN': (83, 95),
+    'PREULT': (109, 121),
+    'TOTNEG': (148, 152),
+    'QUATOT': (153, 170),
+    'VOLTOT': (171, 188),
+    'FATCOT': (211, 217),
+}
+
+MARKET_CASH = '010'
+
+
+def archive_name(year, month=None):
+    '''Returns the COTAHIST archive name of a month, or of a year if month is None'''
+    if month is None:
+        return f'COTAHIST_A{year}'
+    return f'COTAHIST_M{str(month).zfill(2)}{year}'
 
 
 def previous_month(date):
@@ -33,71 +68,271 @@ def previous_month(date):
     return date
 
 
+def _text_field(records: np.ndarray, name: str) -> np.ndarray:
+    '''Returns a fixed-width text field of all records as an array of strings'''
+    start, end = COTAHIST_FIELDS[name]
+    field = np.ascontiguousarray(records[:, start - 1:end])
+    return np.char.strip(field.view(f'S{end - start + 1}').ravel().astype(str))
+
+
+def _int_field(records: np.ndarray, name: str) -> np.ndarray:
+    '''Returns a fixed-width numeric field of all records as int64'''
+    start, end = COTAHIST_FIELDS[name]
+    digits = records[:, start - 1:end].astype(np.int64) - ord('0')
+    return digits @ (10 ** np.arange(end - start, -1, -1, dtype=np.int64))
+
+
+def parse_cotahist(raw: bytes, market_types: tuple = (MARKET_CASH,)) -> pd.DataFrame:
+    '''
+    Parses the content of a COTAHIST file in bulk (no per-line Python loop).
+
+    The file is viewed as a matrix of bytes with one fixed-width record per row,
+    and every field is sliced from all records at once.
+
+    :param raw: Content of the COTAHIST TXT file.
+    :param market_types: Market types (TPMERC) to keep, e.g. '010' for the cash market.
+        None keeps all of them.
+    :return: DataFrame with Date (naive UTC, as the Yahoo cache), Symbol, MarketType,
+        Open, High, Low, Close (per share), Volume (shares traded), Trades and
+        FinancialVolume (BRL).
+    '''
+    columns = ['Date', 'Symbol', 'MarketType', 'Open', 'High', 'Low', 'Close',
+               'Volume', 'Trades', 'FinancialVolume']
+    newline = raw.find(b'\n')
+    if newline < 0:
+        return pd.DataFrame(columns=columns)
+
+    width = newline + 1
+    if len(raw) % width:
+        raw += b' ' * (width - len(raw) % width)
+    records = np.frombuffer(raw, dtype=np.uint8).reshape(-1, width)
+
+    # Only quote records (TIPREG 01), skipping header (00) and trailer (99)
+    records = records[(records[:, 0] == ord('0')) & (records[:, 1] == ord('1'))]
+    market = _text_field(records, 'TPMERC')
+    if market_types is not None:
+        keep = np.isin(market, list(market_types))
+        records = records[keep]
+        market = market[keep]
+
+    # Prices have two implied decimals and are quoted per FATCOT shares
+    factor = _int_field(records, 'FATCOT').astype(float)
+    factor[factor == 0] = 1
+    prices = {name: _int_field(records, field) / 100 / factor
+              for name, field in (('Open', 'PREABE'), ('High', 'PREMAX'),
+                                  ('Low', 'PREMIN'), ('Close', 'PREULT'))}
+
+    dates = pd.to_datetime(_text_field(records, 'DATPRE'), format='%Y%m%d')
+    dates = dates.tz_localize('America/Sao_Paulo').tz_convert('UTC').tz_localize(None)
+
+    return pd.DataFrame({
+        'Date': dates,
+        'Symbol': _text_field(records, 'CODNEG'),
+        'MarketType': market,
+        **prices,
+        'Volume': _int_field(records, 'QUATOT'),
+        'Trades': _int_field(records, 'TOTNEG'),
+        'FinancialVolume': _int_field(records, 'VOLTOT') / 100,
+    }, columns=columns)
+
+
+def save_quotes(quotes: pd.DataFrame, subdir: str = SUB_DIR_B3_HIST) -> List[str]:
+    '''
+    Merges parsed COTAHIST quotes into per-symbol binary history files.
+
+    Each symbol is stored as `{symbol}.SA.npz`, in the same columnar format as the
+    Yahoo cache, so it can be read by `data.B3Data`. Bars already stored for the
+    same date are replaced, so merging the same file twice is harmless.
+
+    :param quotes: DataFrame returned by `parse_cotahist`.
+    :param subdir: Cache subdirectory of the history files.
+    :return: List of symbols (with the .SA suffix) that were written.
+    '''
+    columns = ['Open', 'High', 'Low', 'Close', 'Volume', 'Trades', 'FinancialVolume']
+    quotes = quotes.sort_values(['Symbol', 'Date'], kind='stable')
+    symbols = []
+
+    for symbol, group in quotes.groupby('Symbol', sort=False):
+        asset = symbol + '.SA'
+        arrays: Dict[str, np.ndarray] = {
+            'Date': group['Date'].to_numpy(dtype='datetime64[ns]').astype(np.int64)}
+        arrays.update({column: group[column].to_numpy() for column in columns})
+
+        stored = open_arrays(f"{asset}.npz", subdir)
+        if stored is not None and set(stored) == set(arrays):
+            merged = np.concatenate([stored['Date'], arrays['Date']])
+            # Keeps the most recent version of each date
+            _, last = np.unique(merged[::-1], return_index=True)
+            order = len(merged) - 1 - last
+            arrays = {column: np.concatenate([stored[column], arrays[column]])[order]
+                      for column in arrays}
+
+        save_arrays(f"{asset}.npz", arrays, subdir)
+        symbols.append(asset)
+
+    return symbols
+
+
 class AssetHistory:
     '''Asset history management'''
     _recent_assets_file = RECENT_ASSETS_FILE
     _url = URL_QUOTE
 
     subdir = SUB_DIR_HIST
+    # Cache subdirectories of the downloaded archives and of the imported histories
+    archives_subdir = SUB_DIR_B3_ARCHIVES
+    quotes_subdir = SUB_DIR_B3_HIST
+    # Cache subdirectory of the symbol list and of the information table
+    b3_subdir = SUB_DIR_B3
+    # Records parsed (and merged into the store) at a time by import_quotes
+    chunk_records = CHUNK_RECORDS
 
     @classmethod
-    def _download_quote(cls, year, month):
-        '''Download ZIP file containing historical quotes'''
-        url = cls._url + str(month).zfill(2) + str(year) + '.ZIP'
-        downloaded_file = tempfile.mktemp()
+    def _download_quote(cls, year, month=None):
+        '''
+        Download ZIP file containing historical quotes, keeping it in a local cache.
+
+        :param year: Year of the archive.
+        :param month: Month of the archive, or None for the annual archive.
+        :return: Path of the cached ZIP file.
+        '''
+        name = archive_name(year, month)
+        downloaded_file = file_path(name + '.ZIP', cls.archives_subdir)
+        if isfile(downloaded_file):
+            return downloaded_file
+
+        import requests  # pylint: disable=import-outside-toplevel
+
+        url = cls._url + name + '.ZIP'
+        partial_file = downloaded_file + '.part'
         wait_time = 1
         attempts = 0
 
-        while attempts < 10:
+        while True:
+            attempts += 1
             try:
                 response = requests.get(
                     url, stream=True, timeout=TIMEOUT, verify=False)
-                with open(downloaded_file, 'wb') as file:
+                response.raise_for_status()
+                with open(partial_file, 'wb') as file:
                     for chunk in response.iter_content(chunk_size=8192):
                         file.write(chunk)
+                replace(partial_file, downloaded_file)
                 break
             except Exception as error:  # pylint: disable=broad-except
                 print('Error:', error.__class__.__name__)
                 print(error)
+                not_found = isinstance(error, requests.HTTPError) and \
+                    error.response is not None and error.response.status_code == 404
+                if not_found or attempts >= MAX_ATTEMPTS:
+                    raise
                 wait_time *= 2
                 time.sleep(wait_time)
 
         return downloaded_file
 
     @classmethod
-    def download_symbols(cls):
-        '''Download symbols for recent trades (previous month)'''
-        prev_month = previous_month(datetime.now())
-        temp_dir = tempfile.mkdtemp()
-        file = cls._download_quote(prev_month.year, prev_month.month)
+    def iter_quotes(cls, year, month=None, market_types: tuple = (MARKET_CASH,),
+                    chunk_records: int = CHUNK_RECORDS) -> Iterator[pd.DataFrame]:
+        '''
+        Parses a COTAHIST archive in chunks, streaming the TXT straight out of the
+        cached ZIP without extracting it to disk.
+
+        :param year: Year of the archive.
+        :param month: Month of the archive, or None for the annual archive.
+        :param market_types: Market types (TPMERC) to keep; None keeps all of them.
+        :param chunk_records: Number of records parsed at a time.
+        :return: Generator of DataFrames in the format of `parse_cotahist`.
+        '''
+        file = cls._download_quote(year, month)
 
         with zipfile.ZipFile(file) as zip_ref:
-            zip_ref.extractall(temp_dir)
-        file = temp_dir + '/COTAHIST_M' + \
-            str(prev_month.month).zfill(2) + str(prev_month.year) + '.TXT'
-        symbols_set = set()
+            with zip_ref.open(zip_ref.namelist()[0]) as stream:
+                header = stream.readline()
+                width = len(header)
+                while True:
+                    chunk = stream.read(width * chunk_records)
+                    if not chunk:
+                        break
+                    yield parse_cotahist(chunk, market_types)
 
-        with open(file, 'r', encoding='utf-8') as f:
-            next(f)
-            for line in f:
-                if line[24:27] == '010':
-                    symbol = line[12:24].strip() + '.SA'
-                    symbols_set.add(symbol)
+    @classmethod
+    def import_quotes(cls, year, month=None, lock=None) -> Tuple[int, List[str]]:
+        '''
+        Imports a COTAHIST archive into the B3 history store.
+
+        Each chunk is merged into the per-symbol histories as soon as it is parsed,
+        so only one chunk of the archive is in memory at a time.
+
+        :param year: Year of the archive.
+        :param month: Month of the archive, or None for the annual archive.
+        :param lock: Lock held while each chunk is merged (for concurrent imports).
+        :return: Number of quotes imported and the symbols (with the .SA suffix) written.
+        '''
+        lock = lock or nullcontext()
+        count = 0
+        symbols = set()
+        for quotes in cls.iter_quotes(year, month, chunk_records=cls.chunk_records):
+            with lock:
+                symbols.update(save_quotes(quotes, cls.quotes_subdir))
+            count += len(quotes)
+        return count, sorted(symbols)
+
+    @classmethod
+    def backfill(cls, start: str, end: str, annual: bool = False, max_workers: int = 4) -> DownloadReport:
+        '''
+        Downloads and imports a range of COTAHIST archives concurrently.
+
+        Archives are cached and quotes are merged by date, so running the backfill
+        again (e.g. after an interruption) does not download or duplicate anything;
+        periods finished in an interrupted run are also skipped through a checkpoint.
+
+        :param start: First period (YYYY-MM, or YYYY when annual).
+        :param end: Last period (YYYY-MM, or YYYY when annual).
+        :param annual: If True, imports annual archives instead of monthly ones.
+        :param max_workers: Maximum number of archives downloaded and parsed at once.
+        :return: DownloadReport with the number of quotes imported per archive.
+        '''
+        if annual:
+            periods = {archive_name(year): (year, None)
+                       for year in range(int(start[:4]), int(end[:4]) + 1)}
+        else:
+            periods = {archive_name(month.year, month.month): (month.year, month.month)
+                       for month in pd.period_range(start, end, freq='M')}
+
+        lock = threading.Lock()
+
+        def import_period(name):
+            year, month = periods[name]
+            count, _ = cls.import_quotes(year, month, lock)
+            return count
+
+        # The retries are done by _download_quote
+        downloader = Downloader(max_workers=max_workers, retries=0,
+                                checkpoint=f"backfill_{cls.quotes_subdir}_{start}_{end}.jsonl",
+                                desc="Importing B3 archives", unit="archive")
+        return downloader.run(list(periods), import_period)
+
+    @classmethod
+    def download_symbols(cls):
+        '''Download symbols for recent trades (previous month)'''
+        prev_month = previous_month(datetime.now())
+        _, symbols = cls.import_quotes(prev_month.year, prev_month.month)
 
-        save_json(cls._recent_assets_file, list(symbols_set), SUB_DIR_B3)
+        save_json(cls._recent_assets_file, symbols, cls.b3_subdir)
 
-        return list(symbols_set)
+        return symbols
 
     @classmethod
     def list_recent_symbols(cls, force_update=False):
         '''Returns a list of assets'''
-        item_list = open_json(cls._recent_assets_file, SUB_DIR_B3)
+        item_list = open_json(cls._recent_assets_file, cls.b3_subdir)
 
         if item_list is None or len(item_list) == 0 or force_update:
             symbols = cls.download_symbols()  # 2.2s
             cls.download_info(symbols)
 
-        item_list = open_json(cls._recent_assets_file, SUB_DIR_B3)
+        item_list = open_json(cls._recent_assets_file, cls.b3_subdir)
 
         return item_list
 
@@ -108,45 +343,187 @@ class AssetHistory:
         current_list = [
             symbol for symbol in current_list if symbol in symbol_list]
 
-        save_json(cls._recent_assets_file, current_list, SUB_DIR_B3)
+        save_json(cls._recent_assets_file, current_list, cls.b3_subdir)
         return current_list
 
     @classmethod
-    def download_info(cls, symbols: List[str]) -> List[str]:
-        """Download information for the given list of assets."""
-        desired_fields = {'sector', 'industry'}
-        asset_info = yf.Tickers(symbols)
-        assets_with_info = []
-
-        with tqdm(total=len(asset_info.tickers), desc="Downloading information", unit="asset") as pbar:
-            for asset, ticker_data in asset_info.tickers.items():
-                time.sleep(0.1)
-                try:
-                    asset_info_dict = ticker_data.info
-                    filtered_info = {field: asset_info_dict.get(
-                        field) for field in desired_fields}
-
-                    if all(filtered_info[field] for field in desired_fields):
-                        assets_with_info.append(asset)
-
-                        csv_file_name = f"{asset}_info.csv"
-                        save_dataframe(csv_file_name, pd.DataFrame(
-                            [filtered_info]), cls.subdir)
-
-                    pbar.update(1)
-                except (requests.exceptions.RequestException, KeyError, ValueError) as e:
-                    print(f"Error processing {asset}: {e}")
-                    continue
+    def download_info(cls, symbols: List[str], tickers=None) -> List[str]:
+        """
+        Download information for the given list of assets.
+
+        :param symbols: Symbols of the assets.
+        :param tickers: Client class with the `yfinance.Tickers` interface (default).
+        :return: Symbols with every INFO_FIELDS value, the only ones kept in the symbol list.
+        """
+        if tickers is None:
+            import yfinance as yf  # pylint: disable=import-outside-toplevel
+            tickers = yf.Tickers
+
+        desired_fields = INFO_FIELDS
+        asset_info = tickers(symbols)
+
+        def fetch_info(asset):
+            asset_info_dict = asset_info.tickers[asset].info
+            return {field: asset_info_dict.get(field) for field in desired_fields}
+
+        downloader = Downloader(checkpoint=f"info_{cls.b3_subdir}.jsonl",
+                                no_retry=BAD_SYMBOL_ERRORS, desc="Downloading information",
+                                unit="asset")
+        report = downloader.run(list(asset_info.tickers), fetch_info)
+
+        rows = []
+        for asset in asset_info.tickers:
+            filtered_info = report.results.get(asset)
+            if filtered_info and all(filtered_info[field] for field in desired_fields):
+                rows.append({'symbol': asset, **filtered_info})
+
+        assets_with_info = [row['symbol'] for row in rows]
+        save_dataframe(INFO_FILE, pd.DataFrame(
+            rows, columns=['symbol'] + INFO_FIELDS), cls.b3_subdir)
 
         cls.remove_symbols(assets_with_info)
         return assets_with_info
 
+    @classmethod
+    def get_info_table(cls) -> pd.DataFrame:
+        """
+        Load the information table of the B3 assets, indexed by symbol.
+
+        :return: DataFrame with the INFO_FIELDS columns, or None if it was not downloaded yet.
+        """
+        table = open_dataframe(INFO_FILE, cls.b3_subdir)
+        if table is None:
+            return None
+        return table.set_index('symbol')
+
 
 def update_symbols(update=False):
     '''Update the list of symbols'''
     AssetHistory.list_recent_symbols(force_update=update)
 
 
+def backfill(start: str, end: str, annual: bool = False, max_workers: int = 4):
+    '''Import a range of COTAHIST archives into the B3 history store'''
+    return AssetHistory.backfill(start, end, annual=annual, max_workers=max_workers)
+
+
 def get_symbol_list():
     '''Return the list of symbols'''
     return AssetHistory.list_recent_symbols()
+
+
+def _cotahist_record(date: str, symbol: str, close: float, volume: int) -> str:
+    '''Builds one quote record (TIPREG 01) of a COTAHIST file, for tests'''
+    record = [' '] * 245
+    fields = {
+        'TIPREG': '01', 'DATPRE': date.replace('-', ''), 'CODBDI': '02',
+        'CODNEG': symbol, 'TPMERC': MARKET_CASH, 'TOTNEG': 1, 'QUATOT': volume,
+        'VOLTOT': round(close * volume * 100), 'FATCOT': 1,
+        **{name: round(close * 100) for name in ('PREABE', 'PREMAX', 'PREMIN', 'PREULT')},
+    }
+    for name, value in fields.items():
+        start, end = COTAHIST_FIELDS[name]
+        width = end - start + 1
+        text = str(value).zfill(width) if isinstance(value, int) else value.ljust(width)
+        record[start - 1:end] = text
+    return ''.join(record)
+
+
+def test_backfill():
+    '''
+    Runs AssetHistory.backfill against a local HTTP server serving synthetic COTAHIST
+    archives: checks the merged histories, that a second run downloads and changes
+    nothing, that a transient error is retried and that a missing archive (404) is
+    reported without retries.
+    '''
+    # pylint: disable=import-outside-toplevel
+    import functools
+    import os
+    import shutil
+    import tempfile
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    months = {'2023-01': 10.0, '2023-02': 11.0, '2023-03': 12.0}
+    root = tempfile.mkdtemp()
+    for month, close in months.items():
+        days = pd.bdate_range(month + '-01', periods=5).strftime('%Y-%m-%d')
+        lines = ['00COTAHIST.2023BOVESPA'.ljust(245)]
+        for day_number, day in enumerate(days):
+            for symbol, offset in (('TEST3', 0.0), ('TEST4', 100.0)):
+                lines.append(_cotahist_record(day, symbol, close + offset + day_number, 1000))
+        lines.append('99COTAHIST.2023BOVESPA'.ljust(245))
+        name = archive_name(int(month[:4]), int(month[5:]))
+        with zipfile.ZipFile(os.path.join(root, name + '.ZIP'), 'w') as zip_ref:
+            zip_ref.writestr(name + '.TXT', '\r\n'.join(lines) + '\r\n')
+
+    requests_seen = []
+    flaky = {archive_name(2023, 3) + '.ZIP'}
+
+    class Handler(SimpleHTTPRequestHandler):
+        '''Serves the archives, failing the first request of the flaky ones with 503'''
+
+        def do_GET(self):
+            name = self.path.rsplit('/', 1)[-1]
+            requests_seen.append(name)
+            if name in flaky:
+                flaky.discard(name)
+                self.send_error(503)
+                return
+            super().do_GET()
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(Handler, directory=root))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    class LocalHistory(AssetHistory):
+        '''AssetHistory reading from the local server into temporary cache dirs'''
+        _url = f'http://127.0.0.1:{server.server_address[1]}/'
+        archives_subdir = f'test_b3_archives_{os.getpid()}'
+        quotes_subdir = f'test_b3_historical_{os.getpid()}'
+        chunk_records = 3
+
+    def stored(symbol):
+        return open_arrays(f'{symbol}.SA.npz', LocalHistory.quotes_subdir)
+
+    try:
+        report = LocalHistory.backfill('2023-01', '2023-03', max_workers=2)
+        assert not report.errors, report.errors
+        assert sorted(report.results.values()) == [10, 10, 10]
+        assert requests_seen.count(archive_name(2023, 3) + '.ZIP') == 2, requests_seen
+
+        history = stored('TEST3')
+        dates = history['Date'].astype('datetime64[ns]')
+        assert len(dates) == 15 and np.all(np.diff(dates) > np.timedelta64(0))
+        expected = [close + day for close in months.values() for day in range(5)]
+        assert np.allclose(history['Close'], expected)
+        assert np.allclose(stored('TEST4')['Close'], np.array(expected) + 100)
+
+        before = {symbol: stored(symbol) for symbol in ('TEST3', 'TEST4')}
+        requests_seen.clear()
+        again = LocalHistory.backfill('2023-01', '2023-03', max_workers=2)
+        assert not again.errors and again.results == report.results
+        assert not requests_seen, requests_seen
+        for symbol, arrays in before.items():
+            after = stored(symbol)
+            assert all(np.array_equal(after[column], values) for column, values in arrays.items())
+
+        requests_seen.clear()
+        missing = LocalHistory.backfill('2023-03', '2023-04')
+        assert list(missing.errors) == [archive_name(2023, 4)], missing.errors
+        assert 'HTTPError' in missing.errors[archive_name(2023, 4)]
+        assert requests_seen == [archive_name(2023, 4) + '.ZIP'], requests_seen
+        assert len(stored('TEST3')['Date']) == 15
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(root, ignore_errors=True)
+        for subdir in (LocalHistory.archives_subdir, LocalHistory.quotes_subdir):
+            shutil.rmtree(file_path('', subdir), ignore_errors=True)
+        checkpoint = file_path(f'backfill_{LocalHistory.quotes_subdir}_2023-03_2023-04.jsonl',
+                               'downloads')
+        if isfile(checkpoint):
+            os.remove(checkpoint)
+
+    print('Backfill B3 conferido contra o servidor local')
@@ -2,14 +2,37 @@
     Class Backtesting
 '''
 
-from itertools import product
+import json
+import math
+import os
+import subprocess
+import sys
+from itertools import chain, product
 from typing import List, Dict
 from joblib import Parallel, delayed
 import pandas as pd
+from accumulators import default_accumulators
+from batch import BatchRunner
 from data import MemData
-from ranker import MARanker, RandomRanker
+from metrics import compute_metrics
+from ranker import CachedRanker, MARanker, RandomRanker
+from results_store import ResultStore, result_key
 from runner import Runner
-from utils import generate_filename, save_json, generate_performance_plot
+from utils import generate_filename, save_jsonl, generate_performance_plot
+
+
+def save_result(result):
+    """
+    Salva a timeline e os logs de compra e venda de uma execução em arquivos JSONL.
+    """
+    start_date, end_date = result['intervalo'].split(" - ")
+
+    save_jsonl(generate_filename('timeline', result, start_date,
+               end_date), result['shared_data']['timeline'])
+    save_jsonl(generate_filename('sell_buy_logs/sell_log',
+               result, start_date, end_date), result['sell_log'])
+    save_jsonl(generate_filename('sell_buy_logs/buy_log',
+               result, start_date, end_date), result['buy_log'])
 
 
 def save_results(results):
@@ -17,20 +40,23 @@ def save_results(results):
     Recebe os resultados das execuções paralelizadas e salva os arquivos.
     """
     for result in results:
-        start_date, end_date = result['intervalo'].split(" - ")
+        save_result(result)
+
 
-        save_json(generate_filename('timeline', result, start_date,
-                  end_date), result['shared_data']['timeline'])
-        save_json(generate_filename('sell_buy_logs/sell_log',
-                  result, start_date, end_date), result['sell_log'])
-        save_json(generate_filename('sell_buy_logs/buy_log',
-                  result, start_date, end_date), result['buy_log'])
+def advance_runner(runner: Runner, end_date: str) -> Runner:
+    """
+    Continua a simulação de um Runner até `end_date` e o devolve (para uso com o joblib,
+    que devolve uma cópia do Runner quando executa em outro processo).
+    """
+    runner.advance(end_date)
+    return runner
 
 
 class Backtesting:
     """ Classe para realizar backtesting de uma estratégia de investimento. """
 
-    def __init__(self, ranker_cls, capital: float, interval: List[str], market_identifier: str = None):
+    def __init__(self, ranker_cls, capital: float, interval: List[str], market_identifier: str = None,
+                 shared_memory: bool = False, data: MemData = None):
         """
         Inicializa o backtesting com as informações básicas.
 
@@ -38,18 +64,30 @@ class Backtesting:
         :param capital: Capital inicial para todas as simulações.
         :param interval: Lista com a data inicial e final da simulação.
         :param market_identifier: Sigla ou caminho dos ativos a serem usados.
+        :param shared_memory: Se True, o painel de cotações é gravado uma única vez em
+                              arquivos mapeados em memória e os processos paralelos
+                              acessam essa mesma cópia, em vez de receber os dados serializados.
+        :param data: Dados já carregados (por exemplo, `data.synthetic_mem_data`); se
+                     informados, `market_identifier` é ignorado.
         """
         self.ranker_cls = ranker_cls
         self.capital = capital
         self.interval = interval
         self.runner_cls = Runner
-        self.data = MemData(interval, market_identifier)
+        self.batch_runner_cls = BatchRunner
+        self.store = ResultStore()
+        self.data = MemData(interval, market_identifier) if data is None else data
+        if shared_memory:
+            self.data.share()
 
     def run(
         self,
         parameter_grid: Dict[str, List[float]],
         ranker_grid: Dict[str, List[float]],
-        n_jobs: int = -1
+        n_jobs: int = -1,
+        batch_size: int = None,
+        save_timelines: bool = True,
+        checkpoint: bool = True
     ) -> pd.DataFrame:
         """
         Executa o backtesting variando os parâmetros do Runner e do ranker.
@@ -59,25 +97,60 @@ class Backtesting:
         :param ranker_grid: Dicionário com os parâmetros do rankera variar.
                             Exemplo: {'SEED': [0, 1, 42]}.
         :param n_jobs: Número de processos paralelos (-1 usa todos os núcleos disponíveis).
-        :return: DataFrame com os resultados das simulações.
+        :param batch_size: Se informado, cada tarefa simula até `batch_size` configurações
+                           do Runner (com a mesma configuração do ranker) lado a lado em
+                           um BatchRunner, em vez de uma simulação por configuração.
+        :param save_timelines: Se False, a timeline e os logs de compra e venda não são
+                               gravados em disco; as métricas do DataFrame não dependem deles.
+        :param checkpoint: Se True, o resumo de cada combinação é gravado em `self.store`
+                           assim que ela termina, e as combinações já gravadas (mesmos
+                           parâmetros, ranker, intervalo, mercado, versão dos dados e
+                           capital) não são executadas de novo. Com `save_timelines`,
+                           todas são executadas, já que o resumo gravado não traz a
+                           timeline e os arquivos em results/ seriam de outra execução.
+                           Use False para recalcular tudo.
+        :return: DataFrame com os resultados das simulações (ver `_evaluate_results`).
         """
         runner_params = list(product(*parameter_grid.values()))
         ranker_params = list(product(*ranker_grid.values()))
         parameter_names = list(parameter_grid.keys())
         ranker_names = list(ranker_grid.keys())
 
-        combinations = list(product(runner_params, ranker_params))
+        combinations = list(product(runner_params, range(len(ranker_params))))
+
+        chaves = [
+            result_key(dict(zip(parameter_names, runner_values)), self.ranker_cls,
+                       dict(zip(ranker_names, ranker_params[ranker_indice])),
+                       self.interval, self.data.market, self.data.version, self.capital)
+            for runner_values, ranker_indice in combinations
+        ]
 
-        def run_simulation(params):
-            runner_values, ranker_values = params
+        # Combinações já concluídas em execuções anteriores (só reaproveitadas quando
+        # não há timelines a gravar)
+        resumos = {}
+        if checkpoint and not save_timelines:
+            for indice, chave in enumerate(chaves):
+                gravado = self.store.get(chave)
+                if gravado is not None:
+                    resumos[indice] = gravado
+
+        # Cada configuração do ranker ainda necessária é calculada uma única vez e
+        # compartilhada por todas as configurações do Runner
+        necessarios = sorted({comb[1] for indice, comb in enumerate(combinations)
+                              if indice not in resumos})
+        rankers = dict(zip(necessarios, self._build_rankers(
+            ranker_names, [ranker_params[indice] for indice in necessarios])))
+
+        def run_simulation(indice, params, ranker):
+            runner_values, ranker_indice = params
             runner_config = dict(zip(parameter_names, runner_values))
-            ranker_config = dict(zip(ranker_names, ranker_values))
+            ranker_config = dict(zip(ranker_names, ranker_params[ranker_indice]))
 
             runner = self.runner_cls(
                 profit=runner_config['profit'],
                 loss=runner_config['loss'],
                 diversification=runner_config['diversification'],
-                ranker=self.ranker_cls,
+                ranker=ranker,
                 data=self.data
             )
 
@@ -86,34 +159,314 @@ class Backtesting:
                 results_runner = []
 
                 result = runner.single_run(
-                    self.interval, ranker_config, self.capital)
+                    self.interval, ranker_config, self.capital, keep_timeline=save_timelines)
 
                 results_runner.append(result)
 
-                return self._evaluate_results(results_runner, runner_config, ranker_config)
+                return [(indice, self._evaluate_results(results_runner, runner_config, ranker_config))]
             except Exception as e:
                 print(f"Erro ao rodar configuração {
                       runner_config} com ranker {ranker_config}: {e}")
-                return None
+                return [(indice, None)]
 
-        results = [
-            res for res in Parallel(n_jobs=n_jobs)(
-                delayed(run_simulation)(comb) for comb in combinations
-            ) if res is not None
-        ]
+        def run_batch(itens, ranker):
+            ranker_config = dict(zip(ranker_names, ranker_params[itens[0][1][1]]))
+            runner_configs = [dict(zip(parameter_names, comb[0])) for _, comb in itens]
+
+            batch_runner = self.batch_runner_cls(
+                profits=[config['profit'] for config in runner_configs],
+                losses=[config['loss'] for config in runner_configs],
+                diversifications=[config['diversification'] for config in runner_configs],
+                ranker=ranker,
+                data=self.data
+            )
+
+            try:
+                results_batch = batch_runner.run(
+                    self.interval, ranker_config, self.capital, keep_timeline=save_timelines)
 
-        # descomente para salvar os arquivos de timeline, caso use o MARanker
-        save_results(results)
+                return [
+                    (indice, self._evaluate_results([result], runner_config, ranker_config))
+                    for (indice, _), runner_config, result in zip(itens, runner_configs, results_batch)
+                ]
+            except Exception as e:
+                print(f"Erro ao rodar lote de {len(itens)} configurações com ranker {
+                      ranker_config}: {e}")
+                return [(indice, None) for indice, _ in itens]
+
+        if batch_size:
+            tarefas = []
+            for ranker_indice, ranker in rankers.items():
+                itens = [(indice, comb) for indice, comb in enumerate(combinations)
+                         if comb[1] == ranker_indice and indice not in resumos]
+                for inicio in range(0, len(itens), batch_size):
+                    tarefas.append(delayed(run_batch)(
+                        itens[inicio:inicio + batch_size], ranker))
+        else:
+            tarefas = [
+                delayed(run_simulation)(indice, comb, rankers[comb[1]])
+                for indice, comb in enumerate(combinations)
+                if indice not in resumos
+            ]
+
+        # Os resultados são gravados conforme cada execução termina, mantendo em
+        # memória apenas as métricas de resumo
+        for indice, result in chain.from_iterable(
+            Parallel(n_jobs=n_jobs, return_as="generator_unordered")(tarefas)
+        ):
+            if result is None:
+                continue
+
+            if save_timelines:
+                save_result(result)
 
-        for result in results:
             del result['shared_data']
             del result['sell_log']
             del result['buy_log']
+            resumos[indice] = result
+            if checkpoint:
+                self.store.put(chaves[indice], result)
+
+        results = [resumos[indice] for indice in sorted(resumos)]
 
         return pd.DataFrame(results)
 
+    def search(
+        self,
+        parameter_grid: Dict[str, List[float]],
+        ranker_grid: Dict[str, List[float]],
+        metric: str = 'retorno_mtm',
+        maximize: bool = True,
+        eta: int = 2,
+        min_days: int = 63,
+        n_jobs: int = -1
+    ) -> pd.DataFrame:
+        """
+        Busca por successive halving: todas as configurações são simuladas nos primeiros
+        `min_days` pregões do intervalo, apenas a melhor fração 1/`eta` segue para um
+        horizonte `eta` vezes maior, e assim por diante até o fim do intervalo.
+
+        As simulações sobreviventes continuam de onde pararam (ver `Runner.advance`),
+        sem recomeçar do início. As timelines não são gravadas e a métrica de cada rodada
+        vem dos acumuladores do Runner (ver `accumulators.default_accumulators`). Com
+        `n_jobs` diferente de 1, os Runners vão e voltam dos processos a cada rodada;
+        na volta, as cópias dos dados e dos rankers são trocadas pelos objetos
+        compartilhados (ver `Runner.attach`). Use `shared_memory=True` para que os dados
+        não sejam serializados por inteiro na ida.
+
+        :param parameter_grid: Dicionário com os parâmetros do Runner a variar e seus valores.
+        :param ranker_grid: Dicionário com os parâmetros do ranker a variar.
+        :param metric: Métrica usada para descartar configurações (por exemplo
+                       'retorno_mtm', 'sharpe' ou 'max_drawdown').
+        :param maximize: Se False, valores menores da métrica são melhores.
+        :param eta: Fator de redução das configurações (e de aumento do horizonte) por rodada.
+        :param min_days: Quantidade de pregões da primeira rodada.
+        :param n_jobs: Número de processos paralelos (-1 usa todos os núcleos disponíveis).
+        :return: DataFrame com uma linha por configuração, avaliada no último horizonte que
+                 alcançou ('rodada' e 'dias'), da melhor para a pior.
+        """
+        runner_params = list(product(*parameter_grid.values()))
+        ranker_params = list(product(*ranker_grid.values()))
+        parameter_names = list(parameter_grid.keys())
+        ranker_names = list(ranker_grid.keys())
+
+        rankers = self._build_rankers(ranker_names, ranker_params)
+
+        configs = []
+        runners = []
+        runner_rankers = []
+        for runner_values, ranker_indice in product(runner_params, range(len(ranker_params))):
+            runner_config = dict(zip(parameter_names, runner_values))
+            ranker_config = dict(zip(ranker_names, ranker_params[ranker_indice]))
+            runner = self.runner_cls(
+                profit=runner_config['profit'],
+                loss=runner_config['loss'],
+                diversification=runner_config['diversification'],
+                ranker=rankers[ranker_indice],
+                data=self.data
+            )
+            runner.start(self.interval, ranker_config, self.capital,
+                         keep_timeline=False, accumulators=default_accumulators())
+            configs.append((runner_config, ranker_config))
+            runners.append(runner)
+            runner_rankers.append(rankers[ranker_indice])
+
+        pregoes = self.data.get_trading_days(*self.interval)
+        horizontes = []
+        dias = max(1, min_days)
+        while dias < len(pregoes):
+            horizontes.append(dias)
+            dias *= eta
+        horizontes.append(len(pregoes))
+
+        def pontuacao(runner):
+            valor = runner.result()['stats'].get(metric, float('nan'))
+            if valor is None or math.isnan(valor):
+                return float('-inf')
+            return valor if maximize else -valor
+
+        def resumo(indice, rodada, dias):
+            runner = runners[indice]
+            result = self._evaluate_results(
+                [runner.result()], *configs[indice],
+                interval=[self.interval[0], runner.current_date or self.interval[0]])
+            del result['shared_data']
+            del result['sell_log']
+            del result['buy_log']
+            return {**result, 'rodada': rodada, 'dias': dias}
+
+        vivos = list(range(len(runners)))
+        resumos = {}
+        for rodada, dias in enumerate(horizontes):
+            if not vivos or not pregoes:
+                break
+            fim = pregoes[dias - 1]
+            avancados = Parallel(n_jobs=n_jobs)(
+                delayed(advance_runner)(runners[indice], fim) for indice in vivos)
+            for indice, runner in zip(vivos, avancados):
+                runner.attach(self.data, runner_rankers[indice])
+                runners[indice] = runner
+
+            ultima = rodada == len(horizontes) - 1
+            vivos.sort(key=lambda indice: pontuacao(runners[indice]), reverse=True)
+            manter = len(vivos) if ultima else max(1, math.ceil(len(vivos) / eta))
+            for indice in vivos[manter:]:
+                resumos[indice] = resumo(indice, rodada, dias)
+                runners[indice] = None
+            vivos = vivos[:manter]
+
+            if ultima:
+                for indice in vivos:
+                    resumos[indice] = resumo(indice, rodada, dias)
+
+        results = pd.DataFrame([resumos[indice] for indice in sorted(resumos)])
+        if results.empty:
+            return results
+        colunas = ['rodada', metric] if metric in results else ['rodada']
+        return results.sort_values(colunas, ascending=[False, not maximize][:len(colunas)],
+                                   na_position='last', kind='stable').reset_index(drop=True)
+
+    def walk_forward(
+        self,
+        parameter_grid: Dict[str, List[float]],
+        ranker_grid: Dict[str, List[float]],
+        train_days: int,
+        test_days: int,
+        step_days: int = None,
+        expanding: bool = False,
+        metric: str = 'retorno_mtm',
+        maximize: bool = True,
+        n_jobs: int = -1
+    ) -> pd.DataFrame:
+        """
+        Backtesting walk-forward: os pregões do intervalo são divididos em janelas de
+        treino seguidas de janelas de teste; em cada janela, a melhor configuração no
+        treino (pela `metric`) é simulada no teste, com o capital inicial.
+
+        Todas as janelas usam o mesmo MemData e os mesmos rankings, calculados uma única
+        vez para o intervalo inteiro, e são executadas em paralelo (uma tarefa por janela).
+        Use `shared_memory=True` para que os processos não recebam cópias dos dados.
+
+        :param parameter_grid: Dicionário com os parâmetros do Runner a variar e seus valores.
+        :param ranker_grid: Dicionário com os parâmetros do ranker a variar.
+        :param train_days: Quantidade de pregões de cada janela de treino (a primeira,
+                           se `expanding`).
+        :param test_days: Quantidade de pregões de cada janela de teste.
+        :param step_days: Deslocamento entre janelas consecutivas (padrão: `test_days`).
+        :param expanding: Se True, o treino sempre começa no início do intervalo e cresce
+                          a cada janela; se False, o treino é uma janela móvel.
+        :param metric: Métrica do treino usada para escolher a configuração (por exemplo
+                       'retorno_mtm', 'sharpe' ou 'max_drawdown').
+        :param maximize: Se False, valores menores da métrica são melhores.
+        :param n_jobs: Número de processos paralelos (-1 usa todos os núcleos disponíveis).
+        :return: DataFrame com uma linha por janela: 'janela', 'treino' (intervalo),
+                 a métrica no treino e o resultado da configuração escolhida no teste
+                 (ver `_evaluate_results`).
+        """
+        runner_params = list(product(*parameter_grid.values()))
+        ranker_params = list(product(*ranker_grid.values()))
+        parameter_names = list(parameter_grid.keys())
+        ranker_names = list(ranker_grid.keys())
+
+        combinations = list(product(runner_params, range(len(ranker_params))))
+        rankers = self._build_rankers(ranker_names, ranker_params)
+
+        pregoes = self.data.get_trading_days(*self.interval)
+        step_days = step_days or test_days
+        janelas = []
+        inicio = 0
+        while inicio + train_days + test_days <= len(pregoes):
+            treino = pregoes[0 if expanding else inicio:inicio + train_days]
+            teste = pregoes[inicio + train_days:inicio + train_days + test_days]
+            janelas.append(([treino[0], treino[-1]], [teste[0], teste[-1]]))
+            inicio += step_days
+
+        def simular(runner_values, ranker_indice, interval):
+            runner_config = dict(zip(parameter_names, runner_values))
+            ranker_config = dict(zip(ranker_names, ranker_params[ranker_indice]))
+            runner = self.runner_cls(
+                profit=runner_config['profit'],
+                loss=runner_config['loss'],
+                diversification=runner_config['diversification'],
+                ranker=rankers[ranker_indice],
+                data=self.data
+            )
+            result = runner.single_run(interval, ranker_config, self.capital,
+                                       keep_timeline=False, accumulators=default_accumulators())
+            return result, runner_config, ranker_config
+
+        def run_window(janela, treino, teste):
+            melhor = None
+            for runner_values, ranker_indice in combinations:
+                result, _, _ = simular(runner_values, ranker_indice, treino)
+                valor = result['stats'].get(metric, float('nan'))
+                if valor is None or math.isnan(valor):
+                    continue
+                pontuacao = valor if maximize else -valor
+                if melhor is None or pontuacao > melhor[0]:
+                    melhor = (pontuacao, valor, runner_values, ranker_indice)
+
+            if melhor is None:
+                return None
+
+            _, valor, runner_values, ranker_indice = melhor
+            result, runner_config, ranker_config = simular(runner_values, ranker_indice, teste)
+            resumo = self._evaluate_results([result], runner_config, ranker_config,
+                                            interval=teste)
+            del resumo['shared_data']
+            del resumo['sell_log']
+            del resumo['buy_log']
+            return {
+                'janela': janela,
+                'treino': f"{treino[0]} - {treino[1]}",
+                f'{metric}_treino': valor,
+                **resumo
+            }
+
+        resultados = Parallel(n_jobs=n_jobs)(
+            delayed(run_window)(janela, treino, teste)
+            for janela, (treino, teste) in enumerate(janelas))
+
+        return pd.DataFrame([resultado for resultado in resultados if resultado is not None])
+
+    def _build_rankers(self, ranker_names: List[str], ranker_params: List[tuple]) -> List[CachedRanker]:
+        """
+        Calcula os rankings de cada configuração do ranker para todos os pregões do intervalo.
+
+        :param ranker_names: Nomes dos parâmetros do ranker.
+        :param ranker_params: Combinações de valores dos parâmetros do ranker.
+        :return: Lista de CachedRanker, na mesma ordem de `ranker_params`.
+        """
+        pregoes = self.data.get_trading_days(*self.interval)
+        return [
+            CachedRanker(self.ranker_cls(parameters=dict(zip(ranker_names, values)), data=self.data),
+                         pregoes)
+            for values in ranker_params
+        ]
+
     def _evaluate_results(
-        self, result: List[Dict], runner_params: Dict, ranker_params: Dict
+        self, result: List[Dict], runner_params: Dict, ranker_params: Dict,
+        interval: List[str] = None
     ) -> Dict:
         """
         Calcula métricas de performance da simulação.
@@ -121,8 +474,13 @@ class Backtesting:
         :param result: Resultado da simulação (lista de dicionários).
         :param runner_params: Parâmetros usados na simulação para o Runner.
         :param ranker_params: Parâmetros usados na simulação para o Ranker.
-        :return: Dicionário com as métricas calculadas.
+        :param interval: Intervalo efetivamente simulado (padrão: o intervalo do backtesting).
+        :return: Dicionário com as métricas calculadas: o caixa final, a carteira a preço
+                 de compra e o retorno total formatado, seguidos das métricas numéricas de
+                 `metrics.compute_metrics` (patrimônio a preço de mercado, drawdown, Sharpe,
+                 turnover, taxa de acerto...).
         """
+        interval = interval or self.interval
         caixa_final = result[-1]['balance'] if result else 0
 
         portfolio_value = sum(
@@ -133,17 +491,20 @@ class Backtesting:
         retorno_total = round(retorno_total * 100, 2)
 
         shared_data = result[-1].get('shared_data', {}) if result else {}
+        sell_log = result[-1].get('sell_log', []) if result else []
+        buy_log = result[-1].get('buy_log', []) if result else []
 
         return {
-            'intervalo': f"{self.interval[0]} - {self.interval[1]}",
+            'intervalo': f"{interval[0]} - {interval[1]}",
             **runner_params,
             **ranker_params,
             'caixa_final': caixa_final,
             'portfolio_value': portfolio_value,
             'retorno_total': f"{retorno_total:.2f}%",
+            **compute_metrics(self.data, interval, self.capital, buy_log, sell_log),
             'shared_data': shared_data,
-            'sell_log': result[-1].get('sell_log', []),
-            'buy_log': result[-1].get('buy_log', [])
+            'sell_log': sell_log,
+            'buy_log': buy_log
         }
 
 
@@ -188,5 +549,110 @@ def test_bt_with_ma():
     print(results)
 
 
+def test_bt_walk_forward():
+    interval = ["2020-01-01", "2024-12-31"]
+
+    parameters = {"window": [[9, 21], [20, 50], [50, 200]]}
+
+    backtester = Backtesting(MARanker, capital=10000, interval=interval,
+                             market_identifier="IBOV", shared_memory=True)
+
+    parameter_grid = {
+        'profit': [0.1, 0.15],
+        'loss': [0.05],
+        'diversification': [0.1, 0.2]
+    }
+
+    results = backtester.walk_forward(
+        parameter_grid, ranker_grid=parameters, train_days=252, test_days=63, metric='sharpe')
+
+    print(results)
+
+
+def test_bt_search():
+    interval = ["2024-01-01", "2024-12-31"]
+
+    parameters = {"window": [[9, 21], [20, 50], [50, 200]]}
+
+    backtester = Backtesting(MARanker, capital=10000, interval=interval,
+                             market_identifier="IBOV", shared_memory=True)
+
+    parameter_grid = {
+        'profit': [0.05, 0.1, 0.15, 0.2],
+        'loss': [0.03, 0.05],
+        'diversification': [0.1, 0.2]
+    }
+
+    results = backtester.search(
+        parameter_grid, ranker_grid=parameters, metric='sharpe', eta=2, min_days=42)
+
+    print(results)
+
+
+class _SharedStateRunner(Runner):
+    """
+    Runner que anota, a cada `result` (chamado no processo principal ao fim de cada
+    rodada do `search`), os dados e os rankers que está usando.
+    """
+    seen: List[tuple] = []
+
+    def result(self):
+        self.seen.append((self.data, self.ranker, self._ranker_ativo))
+        return super().result()
+
+
+def test_bt_search_shared_state():
+    """
+    Confere, em dados sintéticos, que depois de cada rodada do `search` em processos
+    paralelos os Runners voltam a usar os dados e os rankers do processo principal,
+    em vez das cópias que vieram dos processos.
+    """
+    from data import synthetic_mem_data  # pylint: disable=import-outside-toplevel
+
+    data = synthetic_mem_data()
+    interval = [data.trading_days[0], data.trading_days[-1]]
+    backtester = Backtesting(MARanker, capital=10000, interval=interval, data=data)
+    backtester.runner_cls = _SharedStateRunner
+    _SharedStateRunner.seen.clear()
+
+    parameter_grid = {'profit': [0.05, 0.1], 'loss': [0.05], 'diversification': [0.3]}
+    ranker_grid = {"window": [[5, 20], [9, 21]]}
+    backtester.search(parameter_grid, ranker_grid, metric='retorno_mtm', eta=2,
+                      min_days=40, n_jobs=2)
+
+    seen = _SharedStateRunner.seen
+    assert seen
+    assert all(runner_data is data for runner_data, _, _ in seen)
+    assert all(ranker is ativo for _, ranker, ativo in seen)
+    assert len({id(ranker) for _, ranker, _ in seen}) == len(ranker_grid["window"])
+
+    print("Runners do search compartilham dados e rankers em", len(seen), "avaliações")
+
+
+def test_import_time(max_seconds: float = 5.0):
+    """
+    Mede, em um interpretador novo (como o de cada processo do joblib), o tempo de
+    importação do backtesting e verifica que as dependências de download e de
+    gráficos só são carregadas quando usadas.
+    """
+    lazy_modules = ["yfinance", "tqdm", "requests", "matplotlib"]
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import backtesting\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"loaded = [name for name in {lazy_modules!r} if name in sys.modules]\n"
+        "print(json.dumps({'elapsed': elapsed, 'loaded': loaded}))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True,
+                            text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+
+    print(f"Importação do backtesting: {result['elapsed']:.3f}s")
+    assert not result['loaded'], f"Módulos importados sem uso: {result['loaded']}"
+    assert result['elapsed'] < max_seconds, f"Importação lenta: {result['elapsed']:.3f}s"
+
+
 if __name__ == "__main__":
     test_bt_with_ma()
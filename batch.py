@@ -0,0 +1,434 @@
+'''
+    class BatchRunner
+'''
+
+from typing import Dict, List, Sequence, Type, Union
+
+import numpy as np
+import pandas as pd
+from data import MemData
+from ranker import Ranker
+
+LOT_FIELDS = ('configs', 'lot_ids', 'symbol_ids', 'quantities',
+              'buy_prices', 'buy_days', 'sector_ids')
+
+
+class BatchRunner:
+    """
+    Simula várias configurações (profit, loss, diversification) lado a lado,
+    percorrendo os pregões uma única vez.
+
+    Os lotes de todas as configurações ficam nos mesmos arrays, com uma coluna que
+    indica a configuração dona de cada lote, e saldo, valor investido e exposição por
+    setor são arrays com uma linha por configuração. As regras de venda e de compra
+    do Runner são aplicadas a todas as configurações de uma vez, produzindo os mesmos
+    resultados de um `Runner.single_run` por configuração.
+    """
+
+    def __init__(self, profits: Sequence[float], losses: Sequence[float], diversifications: Sequence[float],
+                 ranker: Union[Type[Ranker], Ranker], data: MemData):
+        """
+        Inicializa o BatchRunner com uma configuração por posição das listas.
+
+        :param profits: Lucro alvo para venda de cada configuração.
+        :param losses: Limite de perda para venda de cada configuração.
+        :param diversifications: Porcentagem máxima por setor de cada configuração.
+        :param ranker: Classe do ranker a ser utilizada, ou uma instância já construída.
+        :param data: Dados em memória usados por todas as configurações.
+        """
+        self.profit = np.asarray(profits, dtype=float)
+        self.loss = np.asarray(losses, dtype=float)
+        self.diversification = np.asarray(diversifications, dtype=float)
+        if not len(self.profit) == len(self.loss) == len(self.diversification):
+            raise ValueError(
+                "profits, losses e diversifications devem ter o mesmo tamanho.")
+
+        self.ranker = ranker
+        self.data = data
+
+        # Setor de cada ativo do painel (-1 quando não há informação)
+        self.sectors: List[str] = list(data.sectors)
+        self.symbol_sectors = np.asarray(data.sector_ids, dtype=np.int64)
+
+    @property
+    def n_configs(self) -> int:
+        """Quantidade de configurações simuladas."""
+        return len(self.profit)
+
+    def run(self, interval: List[str], ranker_conf: Dict[str, float], capital: float,
+            calendar_days: bool = False, keep_timeline: bool = True) -> List[Dict]:
+        """
+        Executa a simulação de todas as configurações no intervalo.
+
+        :param interval: Lista com a data inicial e final da simulação.
+        :param ranker_conf: Configuração do ranker (ignorada se foi recebida uma instância).
+        :param capital: Capital inicial de cada configuração.
+        :param calendar_days: Se True, a timeline também recebe os dias sem pregão.
+        :param keep_timeline: Se False, a timeline não é gravada.
+        :return: Lista com um resultado por configuração, no formato de `Runner.single_run`.
+        """
+        if isinstance(self.ranker, Ranker):
+            ranker = self.ranker
+        else:
+            ranker = self.ranker(parameters=ranker_conf, data=self.data)
+
+        start_date, end_date = interval
+        k = self.n_configs
+        n_setores = len(self.sectors)
+
+        self.balance = np.full(k, float(capital))
+        self.total = np.zeros(k)
+        self.sector_values = np.zeros((k, n_setores))
+        self.sector_lots = np.zeros((k, n_setores), dtype=np.int64)
+        self.lot_counts = np.zeros(k, dtype=np.int64)
+        self.next_lot = np.zeros(k, dtype=np.int64)
+
+        self.size = 0
+        for campo in LOT_FIELDS:
+            dtype = float if campo == 'buy_prices' else np.int64
+            setattr(self, campo, np.empty(64, dtype=dtype))
+
+        self.sell_logs: List[List[Dict]] = [[] for _ in range(k)]
+        self.buy_logs: List[List[Dict]] = [[] for _ in range(k)]
+        self.timelines: List[List[Dict]] = [[] for _ in range(k)]
+        self.keep_timeline = keep_timeline
+
+        pregoes = self.data.get_trading_days(start_date, end_date)
+
+        if calendar_days:
+            datas = pd.date_range(start_date, end_date).strftime('%Y-%m-%d')
+        else:
+            datas = pregoes
+        pregoes = set(pregoes)
+
+        for date in datas:
+            self._changes = [{} for _ in range(k)] if keep_timeline else None
+            if date in pregoes:
+                self._sell(date)
+                self._buy(date, ranker)
+            self._record_state(date)
+
+        return [
+            {
+                'balance': self.balance[c],
+                'portfolio': self.get_portfolio(c),
+                'shared_data': {
+                    'timeline': self.timelines[c],
+                    'profit': self.profit[c].item(),
+                    'loss': self.loss[c].item(),
+                    'diversification': self.diversification[c].item()
+                },
+                'sell_log': self.sell_logs[c],
+                'buy_log': self.buy_logs[c]
+            }
+            for c in range(k)
+        ]
+
+    def _sell(self, date: str):
+        """
+        Vende, em todas as configurações, os lotes que atingiram o lucro ou a perda.
+
+        :param date: Data atual da simulação.
+        """
+        n = self.size
+        if n == 0:
+            return
+
+        cotacoes = self.data.get_day(date)
+        if cotacoes is None:
+            return
+
+        precos, volumes = cotacoes
+
+        configs = self.configs[:n]
+        ativos = self.symbol_ids[:n]
+        precos_compra = self.buy_prices[:n]
+        precos_atuais = precos[ativos]
+
+        percentual_variacao = (precos_atuais - precos_compra) / precos_compra
+        lotes = np.flatnonzero(
+            (percentual_variacao >= self.profit[configs]) |
+            (percentual_variacao <= -self.loss[configs]))
+
+        if len(lotes) == 0:
+            return
+
+        quantidades = self.quantities[lotes]
+        volumes_lotes = volumes[ativos[lotes]]
+        vendidas = np.where(np.isnan(volumes_lotes), quantidades,
+                            np.minimum(quantidades, volumes_lotes)).astype(np.int64)
+
+        donos = configs[lotes]
+        valores_venda = precos_atuais[lotes] * vendidas
+        np.add.at(self.balance, donos, valores_venda)
+
+        assets = self.data.get_assets()
+        dias = self.data.trading_days
+        for lote, dono, quantidade_vender in zip(lotes.tolist(), donos.tolist(), vendidas.tolist()):
+            preco_atual = precos_atuais[lote]
+            preco_compra = precos_compra[lote]
+            self.sell_logs[dono].append({
+                'data_venda': date,
+                'simbolo': assets[ativos[lote]],
+                'quantidade_vendida': quantidade_vender,
+                'preco_compra': preco_compra,
+                'preco_venda': preco_atual,
+                'lucro_prejuizo': (preco_atual - preco_compra) * quantidade_vender,
+                'data_compra': dias[self.buy_days[lote]]
+            })
+
+        self._reduce(lotes, vendidas)
+
+    def _reduce(self, lotes: np.ndarray, vendidas: np.ndarray):
+        """
+        Retira as quantidades vendidas dos lotes, removendo os lotes zerados.
+
+        :param lotes: Posições dos lotes vendidos.
+        :param vendidas: Quantidade vendida de cada lote.
+        """
+        donos = self.configs[lotes]
+        setores = self.sector_ids[lotes]
+        valores = vendidas * self.buy_prices[lotes]
+
+        self.quantities[lotes] -= vendidas
+        np.subtract.at(self.sector_values, (donos, setores), valores)
+        np.subtract.at(self.total, donos, valores)
+
+        restantes = self.quantities[lotes]
+        if self._changes is not None:
+            for dono, lot_id, quantidade in zip(donos.tolist(), self.lot_ids[lotes].tolist(),
+                                                restantes.tolist()):
+                if quantidade > 0:
+                    self._changes[dono].setdefault('changed', []).append([lot_id, quantidade])
+                else:
+                    self._changes[dono].setdefault('closed', []).append(lot_id)
+
+        encerrados = lotes[restantes <= 0]
+        if len(encerrados) == 0:
+            return
+
+        np.subtract.at(self.sector_lots,
+                       (self.configs[encerrados], self.sector_ids[encerrados]), 1)
+        np.subtract.at(self.lot_counts, self.configs[encerrados], 1)
+        self.sector_values[self.sector_lots == 0] = 0.0
+        self.total[self.lot_counts == 0] = 0.0
+
+        manter = np.ones(self.size, dtype=bool)
+        manter[encerrados] = False
+        n = int(manter.sum())
+        for campo in LOT_FIELDS:
+            array = getattr(self, campo)
+            array[:n] = array[:self.size][manter]
+        self.size = n
+
+    def _buy(self, date: str, ranker: Ranker):
+        """
+        Compra, em todas as configurações, os ativos do ranking do dia, respeitando
+        a diversificação por setor e o volume diário.
+
+        :param date: Data atual da simulação.
+        :param ranker: Instância do ranker a ser utilizado para definir os ativos.
+        """
+        ranked_symbols = ranker.rank(date)
+
+        if not ranked_symbols:
+            return
+
+        cotacoes = self.data.get_day(date)
+        if cotacoes is None:
+            return
+
+        precos, volumes = cotacoes
+        dia = self.data.day_index[date]
+
+        total_portfolio_value = self.total.copy()
+        presentes = (self.sector_lots > 0) & (self.total > 0)[:, None]
+        setor_percentual = np.divide(
+            self.sector_values, self.total[:, None],
+            out=np.zeros_like(self.sector_values), where=presentes)
+
+        balance_disponivel = self.balance.copy()
+
+        for simbolo in ranked_symbols:
+            ativos = balance_disponivel > 2  # Valor mínimo para comprar uma ação
+            if not ativos.any():
+                break
+
+            indice = self.data.symbol_index.get(simbolo)
+            if indice is None:
+                continue
+
+            setor = self.symbol_sectors[indice]
+            if setor < 0:
+                continue
+
+            preco_atual = precos[indice]
+            volume_diario = volumes[indice]
+
+            if np.isnan(preco_atual) or np.isnan(volume_diario):
+                continue
+
+            max_investimento_setor = np.where(
+                presentes[:, setor],
+                total_portfolio_value * self.diversification -
+                setor_percentual[:, setor] * total_portfolio_value,
+                balance_disponivel * self.diversification)
+
+            quantidade_comprar = np.minimum(
+                np.minimum(balance_disponivel // preco_atual,
+                           max_investimento_setor // preco_atual),
+                int(volume_diario))
+
+            compradores = np.flatnonzero(ativos & (quantidade_comprar > 0))
+            if len(compradores) == 0:
+                continue
+
+            quantidades = quantidade_comprar[compradores].astype(np.int64)
+            valores = quantidades * preco_atual
+
+            self._add(compradores, indice, quantidades, preco_atual, dia, setor)
+
+            balance_disponivel[compradores] -= valores
+            total_portfolio_value[compradores] += valores
+            setor_percentual[compradores, setor] += valores / total_portfolio_value[compradores]
+            presentes[compradores, setor] = True
+
+            nome_setor = self.sectors[setor]
+            for dono, quantidade in zip(compradores.tolist(), quantidades.tolist()):
+                self.buy_logs[dono].append({
+                    'data_compra': date,
+                    'simbolo': simbolo,
+                    'quantidade': quantidade,
+                    'preco_compra': preco_atual,
+                    'sector': nome_setor
+                })
+
+        self.balance = balance_disponivel
+
+    def _add(self, donos: np.ndarray, indice: int, quantidades: np.ndarray,
+             preco: float, dia: int, setor: int):
+        """
+        Adiciona um lote do mesmo ativo para cada configuração compradora.
+
+        :param donos: Configurações que compraram o ativo.
+        :param indice: Índice do ativo no painel.
+        :param quantidades: Quantidade comprada por cada configuração.
+        :param preco: Preço de compra.
+        :param dia: Índice do dia de compra no calendário do painel.
+        :param setor: Identificador do setor do ativo.
+        """
+        novos = len(donos)
+        if self.size + novos > len(self.configs):
+            capacidade = max(2 * len(self.configs), self.size + novos)
+            for campo in LOT_FIELDS:
+                array = getattr(self, campo)
+                maior = np.empty(capacidade, dtype=array.dtype)
+                maior[:self.size] = array[:self.size]
+                setattr(self, campo, maior)
+
+        posicoes = slice(self.size, self.size + novos)
+        lot_ids = self.next_lot[donos]
+        self.configs[posicoes] = donos
+        self.lot_ids[posicoes] = lot_ids
+        self.symbol_ids[posicoes] = indice
+        self.quantities[posicoes] = quantidades
+        self.buy_prices[posicoes] = preco
+        self.buy_days[posicoes] = dia
+        self.sector_ids[posicoes] = setor
+        self.size += novos
+
+        valores = quantidades * preco
+        self.next_lot[donos] += 1
+        self.lot_counts[donos] += 1
+        self.total[donos] += valores
+        self.sector_values[donos, setor] += valores
+        self.sector_lots[donos, setor] += 1
+
+        if self._changes is not None:
+            simbolo = self.data.get_assets()[indice]
+            data_compra = self.data.trading_days[dia]
+            for dono, lot_id, quantidade in zip(donos.tolist(), lot_ids.tolist(), quantidades.tolist()):
+                self._changes[dono].setdefault('opened', []).append({
+                    'lote': lot_id,
+                    'simbolo': simbolo,
+                    'quantidade': quantidade,
+                    'preco_compra': float(preco),
+                    'data_compra': data_compra,
+                    'sector': self.sectors[setor]
+                })
+
+    def get_portfolio(self, config: int) -> List[Dict]:
+        """
+        Retorna os lotes em carteira de uma configuração como lista de dicionários.
+
+        :param config: Posição da configuração.
+        :return: Lista de lotes com símbolo, quantidade, preço e data de compra e setor.
+        """
+        assets = self.data.get_assets()
+        dias = self.data.trading_days
+        return [
+            {
+                'simbolo': assets[self.symbol_ids[i]],
+                'quantidade': int(self.quantities[i]),
+                'preco_compra': float(self.buy_prices[i]),
+                'data_compra': dias[self.buy_days[i]],
+                'sector': self.sectors[self.sector_ids[i]]
+            }
+            for i in np.flatnonzero(self.configs[:self.size] == config)
+        ]
+
+    def _record_state(self, date: str):
+        """
+        Grava o saldo e as alterações do dia na timeline de cada configuração,
+        no mesmo formato incremental do Runner.
+
+        :param date: Data atual da simulação.
+        """
+        if not self.keep_timeline:
+            return
+
+        for config, changes in enumerate(self._changes):
+            entry = {'date': date, 'balance': float(self.balance[config])}
+            for chave in ('opened', 'changed', 'closed'):
+                if chave in changes:
+                    entry[chave] = changes[chave]
+            self.timelines[config].append(entry)
+
+
+def test_batch_runner_matches_runner():
+    """
+    Confere, em dados sintéticos, se o BatchRunner produz para cada configuração os
+    mesmos saldo, logs de compra e venda, timeline e carteira final que um
+    `Runner.single_run` com a mesma configuração.
+    """
+    from data import synthetic_mem_data  # pylint: disable=import-outside-toplevel
+    from ranker import MARanker, RandomRanker  # pylint: disable=import-outside-toplevel
+    from runner import Runner  # pylint: disable=import-outside-toplevel
+
+    data = synthetic_mem_data()
+    interval = [data.trading_days[0], data.trading_days[-1]]
+    capital = 10000
+    configs = [(0.05, 0.03, 0.2), (0.1, 0.05, 0.1), (0.15, 0.05, 0.3), (0.1, 0.1, 0.5)]
+
+    for ranker in (MARanker(parameters={"window": [5, 20]}, data=data),
+                   RandomRanker(parameters={"SEED": 42}, data=data)):
+        batch = BatchRunner(*zip(*configs), ranker=ranker, data=data)
+        results = batch.run(interval, ranker.parameters, capital)
+
+        for (profit, loss, diversification), result in zip(configs, results):
+            runner = Runner(profit, loss, diversification, ranker=ranker, data=data)
+            expected = runner.single_run(interval, ranker.parameters, capital)
+
+            nome = f"{type(ranker).__name__} {profit}/{loss}/{diversification}"
+            assert expected['buy_log'] and expected['sell_log'], f"{nome}: sem operações"
+            assert result['balance'] == expected['balance'], nome
+            assert result['portfolio'] == expected['portfolio'], nome
+            assert result['buy_log'] == expected['buy_log'], nome
+            assert result['sell_log'] == expected['sell_log'], nome
+            assert result['shared_data'] == expected['shared_data'], nome
+
+    print("BatchRunner igual ao Runner em", len(configs), "configurações")
+
+
+if __name__ == "__main__":
+    test_batch_runner_matches_runner()
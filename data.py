@@ -4,57 +4,183 @@
 Data class
 '''
 
-import concurrent.futures
+from bisect import bisect_left, bisect_right
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import weakref
 from datetime import datetime
-from typing import Dict, List, Optional
+from os import sep
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
 
+import numpy as np
 import pandas as pd
-import yfinance as yf
-from tqdm import tqdm
-from files import open_dataframe, save_dataframe, save_json
-from b3 import update_symbols, get_symbol_list
-from markets import MarketData
+from downloader import BAD_SYMBOL_ERRORS, DownloadReport, Downloader
+from files import file_path, open_arrays, open_dataframe, save_arrays, save_json
+from b3 import (INFO_FILE as B3_INFO_FILE, SUB_DIR_B3_HIST, AssetHistory, update_symbols,
+                get_symbol_list)
+from markets import INFO_FIELDS, INFO_SOURCES, MARKETS, MarketData, info_file_name
 
 SUB_DIR_HIST = "historical"
+SUB_DIR_SHARED = "shared"
+SUB_DIR_SNAPSHOTS = "snapshots"
+
+# Columns of the histories kept by MemData (and stored in its snapshots)
+SNAPSHOT_COLUMNS = ("Volume", "Close")
+
+
+def history_to_arrays(asset_data: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    Converts a price history into typed columns for the binary cache.
+
+    :param asset_data: History with the dates in the index or in a 'Date' column.
+    :return: Dictionary with 'Date' as int64 UTC nanoseconds and one array per numeric column.
+    """
+    frame = asset_data if "Date" in asset_data.columns else asset_data.reset_index()
+    dates = pd.to_datetime(frame["Date"], utc=True).dt.tz_localize(None)
+
+    arrays = {"Date": dates.to_numpy(dtype="datetime64[ns]").astype(np.int64)}
+    for column in frame.columns:
+        if column != "Date":
+            arrays[column] = pd.to_numeric(frame[column]).to_numpy()
+    return arrays
+
+
+def arrays_to_history(arrays: Dict[str, np.ndarray]) -> pd.DataFrame:
+    """
+    Rebuilds a price history from the typed columns of the binary cache.
+
+    :param arrays: Dictionary produced by `history_to_arrays`.
+    :return: DataFrame with a naive UTC 'Date' column followed by the numeric columns.
+    """
+    data = {"Date": arrays["Date"].astype("datetime64[ns]")}
+    data.update({column: values for column, values in arrays.items()
+                 if column != "Date"})
+    return pd.DataFrame(data)
 
 
 class Yahoo:
     '''Yahoo Finance data management'''
     subdir = SUB_DIR_HIST
 
+    # Yahoo Finance client (the yfinance module, imported on first use); any object
+    # with the same Ticker/Tickers interface can replace it, e.g. a local stand-in in tests
+    client = None
+
+    @classmethod
+    def _yahoo(cls):
+        """Returns the Yahoo Finance client, importing yfinance only when it is needed."""
+        if cls.client is None:
+            import yfinance  # pylint: disable=import-outside-toplevel
+            Yahoo.client = yfinance
+        return cls.client
+
     @classmethod
     def _save_asset_data(cls, asset: str, asset_data) -> None:
-        """Save asset data to JSON and CSV files if data is available."""
+        """Save asset data to the binary history cache if data is available."""
         if asset_data.empty:
             return
 
-        asset_data_reset = asset_data.reset_index()
-        asset_data_reset['Date'] = asset_data_reset['Date'].astype(str)
-        data_dict = asset_data_reset.to_dict(orient='records')
-
-        save_json(f"{asset}.json", data_dict, cls.subdir)
-        save_dataframe(f"{asset}.csv", asset_data_reset, cls.subdir)
+        save_arrays(f"{asset}.npz", history_to_arrays(asset_data), cls.subdir)
 
     @classmethod
     def download_history(cls, asset: str) -> None:
         """Download historical data for a single asset."""
-        asset_data = yf.Ticker(asset).history(period="max")
+        cls._download_full_history(asset)
+
+    @classmethod
+    def _download_full_history(cls, asset: str, ticker: Callable[[str], Any] = None) -> None:
+        """Download and save the full historical data of a single asset."""
+        ticker = ticker or cls._yahoo().Ticker
+        asset_data = ticker(asset).history(period="max")
         cls._save_asset_data(asset, asset_data)
 
     @classmethod
-    def download_histories(cls, assets: List[str]) -> None:
-        """Download historical data for all assets in the list concurrently."""
-        tickers = yf.Tickers(assets)
+    def download_histories(cls, assets: List[str], downloader: Optional[Downloader] = None) -> DownloadReport:
+        """
+        Download historical data for all assets in the list concurrently.
+
+        :param assets: List of asset symbols.
+        :param downloader: Download engine to use (concurrency, rate limit and retries).
+        :return: DownloadReport with the symbols that failed.
+        """
+        tickers = cls._yahoo().Tickers(assets)
         assets_list = list(tickers.tickers.keys())
 
-        with tqdm(total=len(assets_list), desc="Downloading data", unit="asset") as pbar:
-            def download_and_save(asset):
-                cls._save_asset_data(
-                    asset, tickers.tickers[asset].history(period="max"))
-                pbar.update(1)
+        def download_and_save(asset):
+            cls._save_asset_data(
+                asset, tickers.tickers[asset].history(period="max"))
+
+        downloader = downloader or Downloader(no_retry=BAD_SYMBOL_ERRORS, desc="Downloading data")
+        return downloader.run(assets_list, download_and_save)
+
+    @classmethod
+    def update_asset_history(cls, asset: str, ticker: Callable[[str], Any] = None) -> str:
+        """
+        Append the bars missing from the cached history of a single asset.
+
+        Only the tail after the last stored date is fetched. The last stored bar is
+        fetched again to detect adjusted history: if its Close changed, or if the new
+        bars carry dividends or splits (which Yahoo back-adjusts into older prices),
+        the full history is downloaded again.
+
+        :param asset: Asset symbol.
+        :param ticker: Factory of the object whose `history` fetches the bars of a symbol
+            (default `yfinance.Ticker`).
+        :return: 'full' if the whole history was downloaded, 'appended' if new bars
+            were added or 'current' if the cache was already up to date.
+        """
+        ticker = ticker or cls._yahoo().Ticker
+        arrays = open_arrays(f"{asset}.npz", cls.subdir)
+        if arrays is None or len(arrays["Date"]) == 0:
+            cls._download_full_history(asset, ticker)
+            return "full"
+
+        stored = arrays_to_history(arrays)
+        last_date = stored["Date"].iloc[-1]
+
+        tail_data = ticker(asset).history(start=last_date.strftime("%Y-%m-%d"))
+        if tail_data.empty:
+            return "current"
+
+        tail = arrays_to_history(history_to_arrays(tail_data))
+        overlap = tail[tail["Date"].dt.date == last_date.date()]
+        new_bars = tail[tail["Date"].dt.date > last_date.date()]
+
+        adjusted = overlap.empty or not np.isclose(
+            overlap["Close"].iloc[0], stored["Close"].iloc[-1])
+        for column in ("Dividends", "Stock Splits"):
+            if column in new_bars and (new_bars[column].fillna(0) != 0).any():
+                adjusted = True
+
+        if adjusted or list(tail.columns) != list(stored.columns):
+            cls._download_full_history(asset, ticker)
+            return "full"
+
+        if new_bars.empty:
+            return "current"
 
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                executor.map(download_and_save, assets_list)
+        updated = pd.concat([stored, new_bars], ignore_index=True)
+        save_arrays(f"{asset}.npz", history_to_arrays(updated), cls.subdir)
+        return "appended"
+
+    @classmethod
+    def update_histories(cls, assets: List[str], downloader: Optional[Downloader] = None,
+                         ticker: Callable[[str], Any] = None) -> Dict[str, str]:
+        """
+        Incrementally update the cached history of all assets in the list concurrently.
+
+        :param assets: List of asset symbols.
+        :param downloader: Download engine to use (concurrency, rate limit and retries).
+        :param ticker: Ticker factory passed to `update_asset_history`.
+        :return: Dictionary with the result of `update_asset_history` for each asset
+            that did not fail.
+        """
+        downloader = downloader or Downloader(no_retry=BAD_SYMBOL_ERRORS, desc="Updating data")
+        return downloader.run(
+            assets, lambda asset: cls.update_asset_history(asset, ticker)).results
 
     @classmethod
     def get_asset_data(cls, assets: List[str]) -> List[pd.DataFrame]:
@@ -67,14 +193,12 @@ class Yahoo:
         return assets_data
 
     @classmethod
-    def get_info(cls, assets: List[str]) -> List[pd.DataFrame]:
-        '''Load information about one or more assets'''
+    def get_info(cls, assets: List[str], market: str = None) -> List[pd.DataFrame]:
+        '''Load information about one or more assets from the market information tables'''
         info_data = []
-        history = cls()
         for asset in assets:
-            file_name = f"{asset}_info.csv"
-            asset_data = history.load_dataframe(file_name)
-            if not asset_data.empty:
+            asset_data = MarketData.get_info(asset, market)
+            if asset_data is not None and not asset_data.empty:
                 info_data.append(asset_data)
         return info_data
 
@@ -86,13 +210,22 @@ class Yahoo:
     @classmethod
     def get_asset_data_by_name(cls, asset: str) -> pd.DataFrame:
         '''Get historical data for a specific asset'''
-        file_name = f"{asset}.csv"
-        try:
-            return cls.load_dataframe(file_name)
-        except FileNotFoundError:
-            print(f"File {file_name} not found. Downloading data for {asset}.")
-            cls.download_history(asset)
-            return cls.load_dataframe(file_name)
+        file_name = f"{asset}.npz"
+        arrays = open_arrays(file_name, cls.subdir)
+
+        if arrays is None:
+            legacy_data = cls.load_dataframe(f"{asset}.csv")
+            if legacy_data is not None:
+                # Converte o CSV antigo para o cache binário
+                cls._save_asset_data(asset, legacy_data)
+            else:
+                print(f"File {file_name} not found. Downloading data for {asset}.")
+                cls.download_history(asset)
+            arrays = open_arrays(file_name, cls.subdir)
+
+        if arrays is None:
+            return None
+        return arrays_to_history(arrays)
 
 
 class Data(Yahoo):
@@ -117,9 +250,14 @@ class Data(Yahoo):
         return cls.get_info(assets=symbols)
 
     @classmethod
-    def download_history(cls, assets: List[str]) -> None:
+    def download_history(cls, assets: List[str]) -> DownloadReport:
         """Downloads historical data for the given list of assets."""
-        cls.download_histories(assets=assets)
+        return cls.download_histories(assets=assets)
+
+    @classmethod
+    def update_history(cls, assets: List[str]) -> Dict[str, str]:
+        """Incrementally updates the cached historical data of the given list of assets."""
+        return cls.update_histories(assets=assets)
 
     @classmethod
     def fetch_history(cls, assets: List[str]) -> List[dict]:
@@ -127,16 +265,14 @@ class Data(Yahoo):
         Fetches and concatenates historical data for the given list of assets.
         Now returns a list of dictionaries with symbol
         as the key and its corresponding dataframe as the value.
+        Assets without data are left out.
         """
-        asset_data_list = cls.get_asset_data(assets=assets)
-
-        if asset_data_list:
-            result = []
-            for asset, data in zip(assets, asset_data_list):
+        result = []
+        for asset in assets:
+            data = cls.get_asset_data_by_name(asset)
+            if data is not None and not data.empty:
                 result.append({"symbol": asset, "data": data})
-            return result
-        else:
-            return []
+        return result
 
     @classmethod
     def get_history_interval(
@@ -176,8 +312,9 @@ class Data(Yahoo):
             symbol = asset["symbol"]
             data = asset["data"]
 
-            data["Date"] = pd.to_datetime(
-                data["Date"], utc=True).dt.tz_localize(None)
+            if not pd.api.types.is_datetime64_dtype(data["Date"]):
+                data["Date"] = pd.to_datetime(
+                    data["Date"], utc=True).dt.tz_localize(None)
 
             filtered_data = data[
                 (data["Date"] >= start_date_dt) & (data["Date"] <= end_date_dt)
@@ -198,13 +335,37 @@ class Data(Yahoo):
         return result
 
 
+class B3Data(Data):
+    '''Data management backed by the official B3 quotes (COTAHIST files)'''
+    subdir = SUB_DIR_B3_HIST
+
+    @classmethod
+    def get_info(cls, assets: List[str], market: str = None) -> List[pd.DataFrame]:
+        '''Load information about one or more assets (the B3 table is one of the sources)'''
+        return Data.get_info(assets, market)
+
+    @classmethod
+    def download_history(cls, assets: List[str]) -> None:
+        """B3 histories are not downloaded per asset; see `b3.AssetHistory`."""
+        print(f"No B3 history for {assets}. Import the COTAHIST files with b3.AssetHistory.")
+
+
 class MemData:
     '''In-memory data management for assets.'''
 
-    def __init__(self, interval: List[str], market_identifier: str = None):
-        self.history_data: Dict[str, pd.DataFrame] = {}
-        self.info_data: Dict[str, pd.DataFrame] = {}
-        self.data = Data()
+    def __init__(self, interval: List[str], market_identifier: str = None, source: Type[Data] = Data,
+                 snapshot: bool = True):
+        """
+        Loads the assets of a market into memory.
+
+        :param interval: List with the start and end dates of the data.
+        :param market_identifier: Market symbol or file path (default IBRA).
+        :param source: Data class providing the histories, e.g. B3Data to use the
+            official B3 quotes instead of Yahoo Finance.
+        :param snapshot: If True, the prepared data is read from (or saved to) a binary
+            snapshot of the market and interval, rebuilt whenever a source file changes.
+        """
+        self._init_state(source)
 
         # DESCOMENTE PARA USAR B3
         # self.assets = self.data.list_symbols()
@@ -213,11 +374,74 @@ class MemData:
             market_identifier = "IBRA"
 
         market_data = MarketData(market_identifier)
+        self.market = market_data.market
 
         self.assets = market_data.list_recent_symbols(market_data.market)
         print(f"Assets: {self.assets}")
         start_date, end_date = interval
+        if end_date is None:
+            end_date = datetime.today().strftime('%Y-%m-%d')
+
+        symbols = list(self.assets)
+        if snapshot and self.load_snapshot(start_date, end_date, symbols):
+            return
+
         self.load(start_date, end_date)
+        self.version = self._source_version(symbols)
+        if snapshot:
+            self.save_snapshot(start_date, end_date, symbols)
+
+    @classmethod
+    def from_histories(cls, histories: Dict[str, pd.DataFrame],
+                       info_table: pd.DataFrame = None, market: str = None) -> "MemData":
+        """
+        Builds an instance from histories already in memory, without reading the
+        cache (e.g. synthetic data for tests).
+
+        :param histories: Dictionary with asset symbols as keys and histories (indexed
+            by date, with Close and Volume columns) as values.
+        :param info_table: Asset information indexed by symbol (see `INFO_FIELDS`).
+        :param market: Market name recorded in the instance.
+        :return: MemData with the panel and sectors of the given assets.
+        """
+        data = cls.__new__(cls)
+        data._init_state(Data)
+        data.market = market
+        data.assets = list(histories)
+        data.history_data = dict(histories)
+        data._build_panel()
+        data._load_info(pd.DataFrame(columns=INFO_FIELDS) if info_table is None else info_table)
+        return data
+
+    def _init_state(self, source: Type[Data]) -> None:
+        """Sets the attributes of an instance without data."""
+        self.history_data: Dict[str, pd.DataFrame] = {}
+        self.data = source()
+        self.market: Optional[str] = None
+        self.assets: List[str] = []
+
+        # Informações dos ativos: tabela indexada pelo símbolo e setor de cada
+        # ativo do painel como inteiro (índice em `sectors`, -1 sem informação)
+        self.info_table = pd.DataFrame(columns=INFO_FIELDS)
+        self.sectors: List[str] = []
+        self.sector_ids = np.empty(0, dtype=np.int64)
+        self._info_by_symbol: Optional[Dict[str, pd.DataFrame]] = None
+
+        # Painel alinhado dia de pregão x ativo (NaN onde não há cotação)
+        self.trading_days: List[str] = []
+        self.day_index: Dict[str, int] = {}
+        self.symbol_index: Dict[str, int] = {}
+        self.close_panel = np.empty((0, 0))
+        self.volume_panel = np.empty((0, 0))
+        # True onde o ativo tem registro no dia, mesmo com o Close NaN
+        self.bar_panel = np.empty((0, 0), dtype=bool)
+
+        # Impressão digital dos arquivos de origem dos dados (ver `_source_version`)
+        self.version: Optional[str] = None
+
+        # Diretório do painel em memória compartilhada (ver `share`)
+        self.shared_dir: Optional[str] = None
+        self._release = None
 
     def load(self, start_date: str, end_date: str):
         """
@@ -244,15 +468,259 @@ class MemData:
         self.assets = [asset_data["symbol"] for asset_data in historical_data
                        if len(asset_data["data"]) >= threshold]
 
-        filtered_info_data = self.data.get_asset_info(self.assets)
-        self.info_data = {asset: data for asset,
-                          data in zip(self.assets, filtered_info_data)}
-
         self.history_data = {asset_data["symbol"]: asset_data["data"] for asset_data in historical_data
                              if asset_data["symbol"] in self.assets}
 
+        self._build_panel()
+        self._load_info()
+
         print("Data loaded successfully.")
 
+    def _load_info(self, table: pd.DataFrame = None) -> None:
+        """
+        Loads the information table of the market and encodes the sector of every
+        asset of the panel as an integer aligned with `symbol_index`.
+
+        :param table: Information table to use instead of the market's.
+        """
+        if table is None:
+            table = MarketData.get_info_table(self.market)
+        if table is None:
+            table = pd.DataFrame(columns=INFO_FIELDS)
+
+        self.info_table = table.reindex(self.assets)
+        self._info_by_symbol = None
+        codes, sectors = pd.factorize(self.info_table["sector"])
+        self.sectors = [str(sector) for sector in sectors]
+        self.sector_ids = codes.astype(np.int64)
+
+    def _snapshot_name(self, start_date: str, end_date: str) -> str:
+        """Name of the snapshot file of (market, source, interval, columns)."""
+        key = json.dumps([self.market, self.data.subdir, start_date, end_date,
+                          list(SNAPSHOT_COLUMNS)])
+        return f"{self.market.lower()}_{hashlib.sha1(key.encode()).hexdigest()[:16]}.npz"
+
+    def _source_version(self, symbols: List[str]) -> str:
+        """
+        Fingerprint of the files the data is loaded from: the symbol list and the
+        information table of the market and the history of every symbol.
+        """
+        config = MARKETS[self.market]
+        paths = [file_path(config["cache_file"], config["sub_dir"]),
+                 file_path(info_file_name(self.market), config["sub_dir"])]
+        paths += [file_path(f"{symbol}.npz", self.data.subdir) for symbol in symbols]
+
+        digest = hashlib.sha1()
+        for path in paths:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = -1
+            digest.update(f"{path}:{mtime};".encode())
+        return digest.hexdigest()
+
+    def save_snapshot(self, start_date: str, end_date: str, symbols: List[str]) -> None:
+        """
+        Saves the loaded data (histories, panel and asset information) to a snapshot.
+
+        :param start_date: Start date of the loaded interval.
+        :param end_date: End date of the loaded interval.
+        :param symbols: Symbols of the market before filtering, used to fingerprint the sources.
+        """
+        histories = [self.history_data[symbol] for symbol in self.assets]
+        offsets = np.cumsum([0] + [len(history) for history in histories])
+
+        arrays = {
+            "version": np.array(self.version or self._source_version(symbols)),
+            "assets": np.array(self.assets, dtype=str),
+            "trading_days": np.array(self.trading_days, dtype=str),
+            "close_panel": np.asarray(self.close_panel),
+            "volume_panel": np.asarray(self.volume_panel),
+            "bar_panel": np.asarray(self.bar_panel),
+            "history_offsets": offsets.astype(np.int64),
+            "history_Date": np.concatenate(
+                [history.index.to_numpy(dtype="datetime64[ns]") for history in histories]
+                or [np.empty(0, dtype="datetime64[ns]")]).astype(np.int64),
+            "sectors": np.array(self.sectors, dtype=str),
+            "sector_ids": self.sector_ids,
+        }
+        for column in SNAPSHOT_COLUMNS:
+            arrays[f"history_{column}"] = np.concatenate(
+                [history[column].to_numpy() for history in histories] or [np.empty(0)])
+        for field in INFO_FIELDS:
+            arrays[f"info_{field}"] = self.info_table[field].fillna("").astype(str).to_numpy(dtype=str)
+
+        save_arrays(self._snapshot_name(start_date, end_date), arrays, SUB_DIR_SNAPSHOTS)
+
+    def load_snapshot(self, start_date: str, end_date: str, symbols: List[str]) -> bool:
+        """
+        Loads the data from the snapshot of the interval, if it is still up to date.
+
+        :param start_date: Start date of the interval.
+        :param end_date: End date of the interval.
+        :param symbols: Symbols of the market before filtering, used to fingerprint the sources.
+        :return: True if the snapshot was loaded, False if it is missing or outdated.
+        """
+        arrays = open_arrays(self._snapshot_name(start_date, end_date), SUB_DIR_SNAPSHOTS)
+        version = self._source_version(symbols)
+        if arrays is None or str(arrays["version"]) != version or "bar_panel" not in arrays:
+            return False
+
+        self.version = version
+        self.assets = arrays["assets"].tolist()
+        self.trading_days = arrays["trading_days"].tolist()
+        self.symbol_index = {symbol: i for i, symbol in enumerate(self.assets)}
+        self.day_index = {day: i for i, day in enumerate(self.trading_days)}
+        self.close_panel = arrays["close_panel"]
+        self.volume_panel = arrays["volume_panel"]
+        self.bar_panel = arrays["bar_panel"]
+
+        offsets = arrays["history_offsets"]
+        dates = arrays["history_Date"].astype("datetime64[ns]")
+        self.history_data = {}
+        for i, symbol in enumerate(self.assets):
+            start, end = offsets[i], offsets[i + 1]
+            self.history_data[symbol] = pd.DataFrame(
+                {column: arrays[f"history_{column}"][start:end] for column in SNAPSHOT_COLUMNS},
+                index=pd.DatetimeIndex(dates[start:end], name="Date"))
+
+        self.info_table = pd.DataFrame(
+            {field: arrays[f"info_{field}"] for field in INFO_FIELDS},
+            index=pd.Index(self.assets, name="symbol")).replace("", np.nan)
+        self._info_by_symbol = None
+        self.sectors = arrays["sectors"].tolist()
+        self.sector_ids = arrays["sector_ids"]
+
+        print(f"Data loaded from snapshot ({start_date} - {end_date}).")
+        return True
+
+    def _build_panel(self) -> None:
+        """
+        Aligns Close and Volume of every asset in a trading day x symbol panel.
+
+        Rows follow the sorted union of the trading days (YYYY-MM-DD) of all assets
+        and columns follow `self.assets`. Days without a quote for an asset are NaN,
+        and `bar_panel` tells them apart from bars whose Close is NaN.
+        """
+        closes = {}
+        volumes = {}
+        for symbol in self.assets:
+            df_data = self.history_data[symbol]
+            days = df_data.index.strftime('%Y-%m-%d')
+            unique = ~days.duplicated()
+            closes[symbol] = pd.Series(
+                df_data['Close'].to_numpy()[unique], index=days[unique])
+            volumes[symbol] = pd.Series(
+                df_data['Volume'].to_numpy()[unique], index=days[unique])
+
+        self.symbol_index = {symbol: i for i, symbol in enumerate(self.assets)}
+
+        if not closes:
+            self.trading_days = []
+            self.day_index = {}
+            self.close_panel = np.empty((0, 0))
+            self.volume_panel = np.empty((0, 0))
+            self.bar_panel = np.empty((0, 0), dtype=bool)
+            return
+
+        close_df = pd.concat(closes, axis=1).sort_index()
+        volume_df = pd.concat(volumes, axis=1).reindex(close_df.index)
+
+        self.trading_days = list(close_df.index)
+        self.day_index = {day: i for i, day in enumerate(self.trading_days)}
+        self.close_panel = close_df[self.assets].to_numpy(dtype=float)
+        self.volume_panel = volume_df[self.assets].to_numpy(dtype=float)
+        self.bar_panel = np.column_stack(
+            [close_df.index.isin(closes[symbol].index) for symbol in self.assets])
+
+    def share(self) -> str:
+        """
+        Moves the panel to memory-mapped files, so parallel workers attach to a
+        single read-only copy instead of receiving a pickled copy of the data.
+
+        Once shared, pickling this instance only carries the file location, and the
+        per-asset DataFrames of `history_data` stay in the owner process. The files
+        are removed when the owner instance is garbage collected.
+
+        :return: Directory holding the memory-mapped panel.
+        """
+        if self.shared_dir is not None:
+            return self.shared_dir
+
+        self.shared_dir = tempfile.mkdtemp(dir=file_path("", SUB_DIR_SHARED))
+
+        np.save(self.shared_dir + sep + "close.npy", self.close_panel)
+        np.save(self.shared_dir + sep + "volume.npy", self.volume_panel)
+        np.save(self.shared_dir + sep + "bar.npy", self.bar_panel)
+        self._release = weakref.finalize(
+            self, shutil.rmtree, self.shared_dir, True)
+
+        self._attach()
+        return self.shared_dir
+
+    def _attach(self) -> None:
+        """Maps the shared panel files into memory (read-only)."""
+        self.close_panel = np.load(
+            self.shared_dir + sep + "close.npy", mmap_mode="r")
+        self.volume_panel = np.load(
+            self.shared_dir + sep + "volume.npy", mmap_mode="r")
+        self.bar_panel = np.load(
+            self.shared_dir + sep + "bar.npy", mmap_mode="r")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_release"] = None
+        if self.shared_dir is not None:
+            state["close_panel"] = None
+            state["volume_panel"] = None
+            state["bar_panel"] = None
+            state["history_data"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.shared_dir is not None:
+            self._attach()
+
+    def get_trading_days(self, start_date: str, end_date: str) -> List[str]:
+        """
+        Returns the trading days of the market within an interval.
+
+        :param start_date: Start date of the interval (YYYY-MM-DD).
+        :param end_date: End date of the interval (YYYY-MM-DD).
+        :return: Sorted list of dates (YYYY-MM-DD) where at least one asset has a quote.
+        """
+        start = bisect_left(self.trading_days, start_date)
+        end = bisect_right(self.trading_days, end_date)
+        return self.trading_days[start:end]
+
+    def get_day(self, date: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Returns the cross-section of a trading day.
+
+        :param date: Date (YYYY-MM-DD).
+        :return: Tuple with the Close and Volume vectors aligned with `symbol_index`,
+            or None if no asset has a quote on that date.
+        """
+        row = self.day_index.get(date)
+        if row is None:
+            return None
+        return self.close_panel[row], self.volume_panel[row]
+
+    def get_bar(self, date: str, symbol: str) -> Optional[Tuple[float, float]]:
+        """
+        Returns the Close and Volume of an asset on a trading day.
+
+        :param date: Date (YYYY-MM-DD).
+        :param symbol: Asset symbol.
+        :return: Tuple (close, volume), or None if the date or the asset is unknown.
+        """
+        row = self.day_index.get(date)
+        col = self.symbol_index.get(symbol)
+        if row is None or col is None:
+            return None
+        return self.close_panel[row, col], self.volume_panel[row, col]
+
     def get_assets(self) -> List[str]:
         """
         Returns the list of assets in memory.
@@ -273,9 +741,26 @@ class MemData:
         """
         Returns all stored asset information.
 
-        :return: Dictionary with asset symbols as keys and dataframes as values.
+        :return: Dictionary with asset symbols as keys and single-row dataframes as values
+            (assets without information are left out), built once from `info_table`.
         """
-        return self.info_data
+        if self._info_by_symbol is None:
+            table = self.info_table.dropna(subset=["sector"])
+            self._info_by_symbol = {symbol: table.loc[[symbol]].reset_index(drop=True)
+                                    for symbol in table.index}
+        return self._info_by_symbol
+
+    def get_sector(self, symbol: str) -> Optional[str]:
+        """
+        Returns the sector of an asset.
+
+        :param symbol: Asset symbol.
+        :return: Sector name, or None if the asset has no information.
+        """
+        col = self.symbol_index.get(symbol)
+        if col is None or self.sector_ids[col] < 0:
+            return None
+        return self.sectors[self.sector_ids[col]]
 
 
 def teste():
@@ -314,6 +799,150 @@ def teste_sp500():
     # print(Data.get_asset_info("AZUL4.SA"))
 
 
+def synthetic_mem_data(n_assets: int = 12, n_days: int = 250, seed: int = 0) -> MemData:
+    """
+    Builds a MemData with random-walk histories, for checks that must not depend
+    on the cache or on downloads. Some assets miss a few days and a few bars have
+    a NaN close.
+
+    :param n_assets: Number of assets.
+    :param n_days: Number of business days, starting on 2024-01-01.
+    :param seed: Seed of the random generator.
+    :return: MemData with the synthetic assets spread over three sectors.
+    """
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range("2024-01-01", periods=n_days, name="Date")
+
+    histories = {}
+    for i in range(n_assets):
+        close = 20 * np.exp(np.cumsum(rng.normal(0, 0.03, n_days)))
+        volume = rng.integers(0, 5000, n_days).astype(float)
+        history = pd.DataFrame({"Close": close.round(2), "Volume": volume}, index=days)
+        if i % 3 == 1:
+            history = history.drop(days[rng.choice(n_days, n_days // 20, replace=False)])
+        if i % 4 == 2:
+            history.iloc[rng.choice(len(history), 3, replace=False), 0] = np.nan
+        histories[f"SYN{i:02d}"] = history
+
+    info_table = pd.DataFrame(
+        {"sector": [f"Setor {i % 3}" for i in range(n_assets)],
+         "industry": [f"Industria {i % 5}" for i in range(n_assets)]},
+        index=pd.Index(list(histories), name="symbol"))
+    return MemData.from_histories(histories, info_table, market="SYNTHETIC")
+
+
+def test_update_asset_history():
+    """
+    Confere o `Yahoo.update_asset_history` contra um cliente local que imita o
+    `yfinance.Ticker`: acrescenta apenas o final, não faz nada quando o cache está em
+    dia e baixa tudo de novo quando o histórico ajustado muda.
+    """
+    days = pd.bdate_range("2024-01-01", periods=60, tz="America/Sao_Paulo", name="Date")
+    full = pd.DataFrame({"Close": np.linspace(10, 20, len(days)), "Volume": 1000.0,
+                         "Dividends": 0.0, "Stock Splits": 0.0}, index=days)
+    remote = {"history": full.iloc[:40]}
+    requests = []
+
+    class LocalTicker:
+        '''Stand-in for yfinance.Ticker serving `remote["history"]`'''
+
+        def __init__(self, symbol):
+            self.symbol = symbol
+
+        def history(self, period=None, start=None):
+            '''Returns the whole history, or the bars from `start` on'''
+            requests.append(period or start)
+            history = remote["history"]
+            if start is not None:
+                history = history[history.index.strftime("%Y-%m-%d") >= start]
+            return history.copy()
+
+    class Cache(Yahoo):
+        '''Yahoo cache in a temporary subdirectory'''
+        subdir = f"test_update_{os.getpid()}"
+
+    def stored():
+        return arrays_to_history(open_arrays("TEST.npz", Cache.subdir))
+
+    try:
+        assert Cache.update_asset_history("TEST", LocalTicker) == "full"
+        assert len(stored()) == 40
+
+        remote["history"] = full
+        requests.clear()
+        assert Cache.update_asset_history("TEST", LocalTicker) == "appended"
+        assert requests == [days[39].strftime("%Y-%m-%d")], requests
+        assert np.array_equal(stored()["Close"], full["Close"])
+
+        requests.clear()
+        assert Cache.update_asset_history("TEST", LocalTicker) == "current"
+        assert requests == [days[-1].strftime("%Y-%m-%d")], requests
+        assert len(stored()) == len(days)
+
+        adjusted = full.assign(Close=full["Close"] * 0.9)
+        remote["history"] = adjusted
+        assert Cache.update_asset_history("TEST", LocalTicker) == "full"
+        assert np.array_equal(stored()["Close"], adjusted["Close"])
+    finally:
+        shutil.rmtree(file_path("", Cache.subdir), ignore_errors=True)
+
+    print("Atualização incremental do histórico conferida")
+
+
+def test_b3_info():
+    """
+    Confere o caminho das informações da B3: `AssetHistory.download_info`, com um
+    cliente local que imita o `yfinance.Tickers`, grava a tabela que o
+    `B3Data.get_info` lê, memorizada até o arquivo mudar.
+    """
+    infos = {"TEST3": {"sector": "Energy", "industry": "Oil"},
+             "TEST4": {"sector": "Utilities", "industry": "Power"},
+             "TEST5": {"sector": None, "industry": "Unknown"}}
+
+    class LocalTicker:
+        '''Stand-in for yfinance.Ticker serving `infos`'''
+
+        def __init__(self, symbol):
+            self.info = dict(infos[symbol])
+
+    class LocalTickers:
+        '''Stand-in for yfinance.Tickers'''
+
+        def __init__(self, symbols):
+            self.tickers = {symbol: LocalTicker(symbol) for symbol in symbols}
+
+    class LocalHistory(AssetHistory):
+        '''AssetHistory keeping its symbol list and information table in a temporary dir'''
+        b3_subdir = f"test_b3_info_{os.getpid()}"
+
+    info_path = file_path(B3_INFO_FILE, LocalHistory.b3_subdir)
+    save_json(LocalHistory._recent_assets_file, list(infos), LocalHistory.b3_subdir)
+    INFO_SOURCES["TEST_B3"] = (B3_INFO_FILE, LocalHistory.b3_subdir)
+    try:
+        assert LocalHistory.download_info(list(infos), LocalTickers) == ["TEST3", "TEST4"]
+        assert LocalHistory.list_recent_symbols() == ["TEST3", "TEST4"]
+
+        info = B3Data.get_info(["TEST3", "TEST4", "TEST5"], "TEST_B3")
+        assert [row.iloc[0].to_dict() for row in info] == [infos["TEST3"], infos["TEST4"]]
+        assert B3Data.get_info(["TEST4"])[0].iloc[0]["sector"] == "Utilities"
+
+        table = MarketData.get_info_table("TEST_B3")
+        assert MarketData.get_info_table("TEST_B3") is table
+        assert table.equals(LocalHistory.get_info_table())
+
+        infos["TEST4"]["sector"] = "Energy"
+        LocalHistory.download_info(list(infos), LocalTickers)
+        os.utime(info_path, ns=(0, 0))  # distinto do mtime memorizado mesmo num relógio grosso
+        assert MarketData.get_info_table("TEST_B3") is not table
+        assert B3Data.get_info(["TEST4"], "TEST_B3")[0].iloc[0]["sector"] == "Energy"
+    finally:
+        INFO_SOURCES.pop("TEST_B3", None)
+        MarketData.clear_cache()
+        shutil.rmtree(file_path("", LocalHistory.b3_subdir), ignore_errors=True)
+
+    print("Informações da B3 conferidas")
+
+
 def teste_mem_data():
     interval = ["2024-01-10", "2024-11-10"]
     mem_data = MemData(interval)
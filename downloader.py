@@ -0,0 +1,204 @@
+'''
+Download engine
+'''
+
+import concurrent.futures
+import json
+import random
+import threading
+import time
+from os import remove
+from os.path import isfile
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type
+
+from files import file_path
+
+SUB_DIR_DOWNLOADS = "downloads"
+
+# Errors raised by yfinance for delisted or unknown tickers; retrying does not help
+BAD_SYMBOL_ERRORS = (KeyError, ValueError)
+
+
+class RateLimiter:
+    '''Thread-safe token bucket limiting how many requests start per second'''
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        """
+        :param rate: Tokens added per second (sustained requests per second).
+        :param burst: Bucket size (requests allowed at once). Defaults to `rate`, at least 1.
+        """
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Blocks until a token is available and takes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class DownloadReport:
+    '''Outcome of a Downloader run'''
+
+    def __init__(self):
+        self.results: Dict[str, Any] = {}
+        self.errors: Dict[str, str] = {}
+        self.resumed: List[str] = []
+
+    def __repr__(self):
+        return (f"DownloadReport(ok={len(self.results)}, errors={len(self.errors)}, "
+                f"resumed={len(self.resumed)})")
+
+
+class Downloader:
+    '''
+    Shared download engine: bounded concurrency, token-bucket rate limiting,
+    exponential backoff with jitter, per-item error reporting and resumability.
+    '''
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        rate: float = 10.0,
+        burst: Optional[int] = None,
+        retries: int = 4,
+        backoff: float = 1.0,
+        max_backoff: float = 30.0,
+        checkpoint: Optional[str] = None,
+        no_retry: Tuple[Type[BaseException], ...] = (),
+        desc: str = "Downloading",
+        unit: str = "asset",
+    ):
+        """
+        :param max_workers: Maximum number of concurrent downloads.
+        :param rate: Maximum number of requests started per second (all workers together).
+        :param burst: Number of requests that may start at once after an idle period.
+        :param retries: Attempts after the first failure before giving up on an item.
+        :param backoff: Base wait, in seconds, before the first retry. It doubles on
+            every retry, capped at `max_backoff`, and a random jitter is applied.
+        :param max_backoff: Maximum wait between retries, in seconds.
+        :param checkpoint: Name of a checkpoint file (JSON lines). Each result is appended
+            there as its item completes, and a later run with the same checkpoint skips
+            them. The file is removed once a run finishes without errors. Results must be
+            JSON serializable.
+        :param no_retry: Exception types that fail an item at once, without retries
+            (e.g. `BAD_SYMBOL_ERRORS`).
+        :param desc: Progress bar description.
+        :param unit: Progress bar unit.
+        """
+        self.max_workers = max_workers
+        self.limiter = RateLimiter(rate, burst)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.checkpoint = checkpoint
+        self.no_retry = tuple(no_retry)
+        self.desc = desc
+        self.unit = unit
+        self._lock = threading.Lock()
+
+    def run(self, items: Iterable[str], task: Callable[[str], Any]) -> DownloadReport:
+        """
+        Runs `task` for every item and collects the results.
+
+        :param items: Items to download (usually symbols).
+        :param task: Function called with one item; exceptions trigger retries, except
+            those in `no_retry`.
+        :return: DownloadReport with the results and the errors of every item.
+        """
+        from tqdm import tqdm  # pylint: disable=import-outside-toplevel
+
+        report = DownloadReport()
+        done = self._load_checkpoint()
+        pending = []
+        for item in items:
+            if item in done:
+                report.results[item] = done[item]
+                report.resumed.append(item)
+            else:
+                pending.append(item)
+
+        checkpoint = None
+        if self.checkpoint and pending:
+            checkpoint = open(file_path(self.checkpoint, SUB_DIR_DOWNLOADS), 'a', encoding='utf-8')
+
+        try:
+            with tqdm(total=len(pending), desc=self.desc, unit=self.unit) as pbar:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    futures = {executor.submit(self._attempt, task, item): item for item in pending}
+                    for future in concurrent.futures.as_completed(futures):
+                        item = futures[future]
+                        try:
+                            result = future.result()
+                        except Exception as error:  # pylint: disable=broad-except
+                            report.errors[item] = f"{error.__class__.__name__}: {error}"
+                        else:
+                            report.results[item] = result
+                            if checkpoint:
+                                with self._lock:
+                                    checkpoint.write(json.dumps(
+                                        {'item': item, 'result': result}, ensure_ascii=False) + '\n')
+                                    checkpoint.flush()
+                        pbar.update(1)
+        finally:
+            if checkpoint:
+                checkpoint.close()
+
+        for item, error in report.errors.items():
+            print(f"Error downloading {item}: {error}")
+
+        if self.checkpoint and not report.errors:
+            self._clear_checkpoint()
+
+        return report
+
+    def _attempt(self, task: Callable[[str], Any], item: str) -> Any:
+        """Calls `task(item)`, retrying with exponential backoff and jitter."""
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                return task(item)
+            except self.no_retry:
+                raise
+            except Exception:  # pylint: disable=broad-except
+                if attempt >= self.retries:
+                    raise
+                wait = min(self.max_backoff, self.backoff * 2 ** attempt)
+                time.sleep(random.uniform(wait / 2, wait))
+                attempt += 1
+
+    def _load_checkpoint(self) -> Dict[str, Any]:
+        """Returns the results recorded in the checkpoint file, if any."""
+        if not self.checkpoint:
+            return {}
+        file_name = file_path(self.checkpoint, SUB_DIR_DOWNLOADS)
+        if not isfile(file_name):
+            return {}
+
+        done = {}
+        with open(file_name, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # incomplete line left by an interrupted run
+                done[record['item']] = record['result']
+        return done
+
+    def _clear_checkpoint(self) -> None:
+        """Removes the checkpoint file."""
+        file_name = file_path(self.checkpoint, SUB_DIR_DOWNLOADS)
+        if isfile(file_name):
+            remove(file_name)
@@ -5,9 +5,10 @@ Files
 '''
 
 import json
-from os.path import isdir, isfile
-from os import mkdir, sep
+from os.path import isfile
+from os import makedirs, sep
 from pathlib import Path
+import numpy as np
 import pandas as pd
 
 DIR_CACHE = '.cache/port_back'
@@ -15,21 +16,18 @@ DIR_CACHE = '.cache/port_back'
 
 def dir_cache():
     '''Data directory'''
-    _data_dir = str(Path.home()) + sep + DIR_CACHE
-    if not isdir(_data_dir):
-        mkdir(_data_dir)
-    return _data_dir
+    directory = str(Path.home()) + sep + DIR_CACHE
+    makedirs(directory, exist_ok=True)
+    return directory
 
 
 def file_path(file_name, subdir=None):
     '''Symbol file'''
     directory = dir_cache()
     if subdir:
-        directory += sep + subdir
-    if not isdir(directory):
-        mkdir(directory)
-    file_name = directory + sep + file_name
-    return file_name
+        directory = directory + sep + subdir
+        makedirs(directory, exist_ok=True)
+    return directory + sep + file_name
 
 
 def open_json(file, subdir=None):
@@ -62,6 +60,21 @@ def save_dataframe(file, dataframe, subdir=None):
     dataframe.to_csv(file_name, index=False)
 
 
+def open_arrays(file, subdir=None):
+    '''Opens NPZ file as a dictionary of typed columns'''
+    file_name = file_path(file, subdir)
+    if isfile(file_name):
+        with np.load(file_name, allow_pickle=False) as arrays:
+            return {key: arrays[key] for key in arrays.files}
+    return None
+
+
+def save_arrays(file, arrays, subdir=None):
+    '''Saves a dictionary of typed columns to an NPZ file'''
+    file_name = file_path(file, subdir)
+    np.savez(file_name, **arrays)
+
+
 def main():
     '''Main function'''
     print(file_path('test.txt'))
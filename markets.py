@@ -1,11 +1,9 @@
 import os
-import time
-from typing import List
+from typing import Dict, List, Tuple
 import pandas as pd
-import yfinance as yf
-import requests
-from tqdm import tqdm
-from files import open_dataframe, open_json, save_json, save_dataframe
+from b3 import INFO_FILE as B3_INFO_FILE, SUB_DIR_B3
+from downloader import BAD_SYMBOL_ERRORS, Downloader
+from files import file_path as cache_file_path, open_dataframe, open_json, save_json, save_dataframe
 
 MARKETS = {
     "IBOV": {"cache_file": "recent_assets_ibov.json", "sub_dir": "ibov", "source_file": "assets/IBOVQuad.csv"},
@@ -18,6 +16,17 @@ MARKETS = {
 
 
 SUB_DIR_HIST = "historical"
+INFO_FIELDS = ["sector", "industry"]
+
+# Tabelas de informações mantidas fora de MARKETS: nome -> (arquivo, subdiretório)
+INFO_SOURCES = {
+    "B3": (B3_INFO_FILE, SUB_DIR_B3)
+}
+
+
+def info_file_name(market: str) -> str:
+    """Nome da tabela de informações (uma linha por ativo) de um mercado."""
+    return f"info_{market.lower()}.csv"
 
 
 def read_symbols(file_path):
@@ -41,6 +50,13 @@ def read_symbols(file_path):
 class MarketData:
     """Gerenciamento de dados dos mercados configurados em MARKETS."""
 
+    # Registro do processo: mercado de cada identificador já resolvido, lista de
+    # símbolos e tabela de informações (com um dicionário por símbolo) de cada
+    # mercado, junto com o mtime do arquivo lido
+    _resolved: Dict[str, str] = {}
+    _symbols: Dict[str, Tuple[int, List[str]]] = {}
+    _info: Dict[str, Tuple[int, pd.DataFrame, Dict[str, dict]]] = {}
+
     def __init__(self, file_path: str = None):
         """
             Inicializa a instância de MarketData a partir de uma sigla de mercado ou caminho de arquivo.
@@ -80,6 +96,10 @@ class MarketData:
             raise ValueError(
                 "É necessário fornecer um 'file_path' ou uma sigla de mercado válida.")
 
+        market = cls._resolved.get(file_path)
+        if market is not None and market in MARKETS:
+            return market
+
         market = None
         if file_path.upper() in MARKETS:
             market = file_path.upper()
@@ -99,8 +119,23 @@ class MarketData:
             }
 
         cls.list_recent_symbols(market)
+        cls._resolved[file_path] = market
         return market
 
+    @classmethod
+    def clear_cache(cls):
+        """Descarta os mercados resolvidos e as listas de símbolos e tabelas memorizadas."""
+        cls._resolved.clear()
+        cls._symbols.clear()
+        cls._info.clear()
+
+    @classmethod
+    def _save_symbols(cls, market: str, symbols: List[str]):
+        """Grava a lista de símbolos de um mercado e descarta a versão memorizada."""
+        config = MARKETS[market]
+        save_json(config["cache_file"], symbols, config["sub_dir"])
+        cls._symbols.pop(market, None)
+
     @classmethod
     def download_data(cls, market: str):
         """Carrega e processa os dados do mercado definido."""
@@ -115,7 +150,7 @@ class MarketData:
             symbols = [
                 symbol + ".SA" for symbol in read_symbols(config["source_file"])]
 
-        save_json(config["cache_file"], symbols, config["sub_dir"])
+        cls._save_symbols(market, symbols)
         print(f"{market}: {len(symbols)} ativos")
 
         return {market: symbols}
@@ -139,23 +174,130 @@ class MarketData:
             raise ValueError(
                 f"Mercado inválido. Opções disponíveis: {list(MARKETS.keys())}")
 
-        config = MARKETS[market]
-        item_list = open_json(config["cache_file"], config["sub_dir"])
-
-        if item_list is None or force_update:
+        if force_update or cls._read_symbols(market) is None:
             print(f"Baixando dados para {market}...")
             cls.download_data(market)
             cls.download_info(market)
 
+        item_list = cls._read_symbols(market)
+        return None if item_list is None else list(item_list)
+
+    @classmethod
+    def _read_symbols(cls, market: str):
+        """
+        Lê a lista de símbolos do cache de um mercado, reaproveitando a leitura anterior
+        enquanto o mtime do arquivo não mudar.
+        """
+        config = MARKETS[market]
+        try:
+            mtime = os.stat(cache_file_path(config["cache_file"], config["sub_dir"])).st_mtime_ns
+        except FileNotFoundError:
+            cls._symbols.pop(market, None)
+            return None
+
+        cached = cls._symbols.get(market)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
         item_list = open_json(config["cache_file"], config["sub_dir"])
+        if item_list is not None:
+            cls._symbols[market] = (mtime, item_list)
         return item_list
 
     @classmethod
-    def get_info(cls, symbol: str):
-        """Obtém informações salvas localmente para um ativo."""
-        csv_file_name = f"{symbol}_info.csv"
-        print(f"Lendo {csv_file_name}...")
-        return open_dataframe(csv_file_name, SUB_DIR_HIST)
+    def get_info(cls, symbol: str, market: str = None):
+        """
+        Obtém informações salvas localmente para um ativo.
+
+        Procura o ativo na tabela de informações do mercado informado ou, sem mercado,
+        nas de todos os mercados de MARKETS e de INFO_SOURCES, nessa ordem.
+
+        :return: DataFrame de uma linha com as colunas de INFO_FIELDS, ou None.
+        """
+        markets = [market] if market else list(MARKETS) + list(INFO_SOURCES)
+        for name in markets:
+            record = cls._read_info(name)[1].get(symbol)
+            if record is not None:
+                return pd.DataFrame([record], columns=INFO_FIELDS)
+        return None
+
+    @classmethod
+    def get_info_table(cls, market: str):
+        """
+        Lê a tabela de informações de um mercado, indexada pelo símbolo.
+
+        :param market: Sigla do mercado (de MARKETS ou de INFO_SOURCES).
+        :return: DataFrame com as colunas de INFO_FIELDS, ou None se não houver informações.
+            A tabela é compartilhada entre as chamadas e não deve ser alterada.
+        """
+        return cls._read_info(market)[0]
+
+    @classmethod
+    def _info_location(cls, market: str) -> Tuple[str, str]:
+        """Arquivo e subdiretório da tabela de informações de um mercado."""
+        if market in MARKETS:
+            return info_file_name(market), MARKETS[market]["sub_dir"]
+        if market in INFO_SOURCES:
+            return INFO_SOURCES[market]
+        raise ValueError(
+            f"Mercado inválido. Opções disponíveis: {list(MARKETS) + list(INFO_SOURCES)}")
+
+    @classmethod
+    def _read_info(cls, market: str) -> Tuple[pd.DataFrame, Dict[str, dict]]:
+        """
+        Lê a tabela de informações de um mercado e o dicionário de cada símbolo,
+        reaproveitando a leitura anterior enquanto o mtime do arquivo não mudar.
+        """
+        file_name, subdir = cls._info_location(market)
+        try:
+            mtime = os.stat(cache_file_path(file_name, subdir)).st_mtime_ns
+        except FileNotFoundError:
+            cls._info.pop(market, None)
+            return None, {}
+
+        cached = cls._info.get(market)
+        if cached is not None and cached[0] == mtime:
+            return cached[1], cached[2]
+
+        table = open_dataframe(file_name, subdir).set_index("symbol")[INFO_FIELDS]
+        records = {str(symbol): record for symbol, record
+                   in zip(table.index, table.to_dict("records"))}
+        cls._info[market] = (mtime, table, records)
+        return table, records
+
+    @classmethod
+    def migrate_legacy_info(cls, markets: List[str] = None) -> Dict[str, int]:
+        """
+        Converte os arquivos antigos `{symbol}_info.csv`, um por ativo, na tabela de
+        informações de cada mercado que ainda não tem uma. Os arquivos antigos passam a
+        ser ignorados.
+
+        :param markets: Siglas dos mercados; por padrão, todos de MARKETS.
+        :return: Número de ativos migrados por mercado.
+        """
+        migrated = {}
+        for market in markets or list(MARKETS):
+            config = MARKETS[market]
+            if os.path.isfile(cache_file_path(info_file_name(market), config["sub_dir"])):
+                continue
+
+            symbols = open_json(config["cache_file"], config["sub_dir"]) or []
+            rows = []
+            for symbol in symbols:
+                legacy = open_dataframe(f"{symbol}_info.csv", SUB_DIR_HIST)
+                if legacy is not None and not legacy.empty:
+                    rows.append({"symbol": symbol, **legacy.iloc[0][INFO_FIELDS].to_dict()})
+            if rows:
+                cls.save_info_table(market, pd.DataFrame(rows, columns=["symbol"] + INFO_FIELDS))
+                migrated[market] = len(rows)
+        return migrated
+
+    @classmethod
+    def save_info_table(cls, market: str, table: pd.DataFrame):
+        """Grava a tabela de informações de um mercado (colunas 'symbol' e INFO_FIELDS)."""
+        save_dataframe(info_file_name(market), table[["symbol"] + INFO_FIELDS],
+                       MARKETS[market]["sub_dir"])
+        cls._info.pop(market, None)
 
     @classmethod
     def remove_symbols(cls, market: str, symbol_list: List[str]):
@@ -169,8 +311,7 @@ class MarketData:
         updated_list = [
             symbol for symbol in current_list if symbol in symbol_list]
 
-        save_json(MARKETS[market]["cache_file"],
-                  updated_list, MARKETS[market]["sub_dir"])
+        cls._save_symbols(market, updated_list)
         return updated_list
 
     @classmethod
@@ -181,28 +322,27 @@ class MarketData:
             print(f"Nenhum ativo encontrado para {market}.")
             return []
 
-        desired_fields = {"sector", "industry"}
+        import yfinance as yf  # pylint: disable=import-outside-toplevel
+
+        desired_fields = INFO_FIELDS
         asset_info = yf.Tickers(symbols)
-        assets_with_info = []
-
-        with tqdm(total=len(asset_info.tickers), desc=f"Baixando infos {market}", unit="ativo") as pbar:
-            for asset, ticker_data in asset_info.tickers.items():
-                time.sleep(0.1)
-                try:
-                    asset_info_dict = ticker_data.info
-                    filtered_info = {field: asset_info_dict.get(
-                        field) for field in desired_fields}
-
-                    if all(filtered_info[field] for field in desired_fields):
-                        assets_with_info.append(asset)
-                        csv_file_name = f"{asset}_info.csv"
-                        save_dataframe(csv_file_name, pd.DataFrame(
-                            [filtered_info]), SUB_DIR_HIST)
-
-                    pbar.update(1)
-                except (requests.exceptions.RequestException, KeyError, ValueError) as e:
-                    print(f"Erro ao processar {asset}: {e}")
-                    continue
+
+        def fetch_info(asset):
+            asset_info_dict = asset_info.tickers[asset].info
+            return {field: asset_info_dict.get(field) for field in desired_fields}
+
+        downloader = Downloader(checkpoint=f"info_{market.lower()}.jsonl",
+                                no_retry=BAD_SYMBOL_ERRORS, desc=f"Baixando infos {market}", unit="ativo")
+        report = downloader.run(list(asset_info.tickers), fetch_info)
+
+        rows = []
+        for asset in asset_info.tickers:
+            filtered_info = report.results.get(asset)
+            if filtered_info and all(filtered_info[field] for field in desired_fields):
+                rows.append({"symbol": asset, **filtered_info})
+
+        assets_with_info = [row["symbol"] for row in rows]
+        cls.save_info_table(market, pd.DataFrame(rows, columns=["symbol"] + INFO_FIELDS))
 
         cls.remove_symbols(market, assets_with_info)
         return assets_with_info
@@ -212,7 +352,12 @@ def list_recent_symbols(market: str, force_update=False):
     return MarketData.list_recent_symbols(market, force_update)
 
 
+def migrate_legacy_info(markets: List[str] = None):
+    return MarketData.migrate_legacy_info(markets)
+
+
 def teste():
+    print(migrate_legacy_info())
     data = MarketData("assets/s&p500.csv")
     symbols_ibra = data.list_recent_symbols("SP500", force_update=True)
     print(len(symbols_ibra))
@@ -0,0 +1,122 @@
+'''
+    Métricas de desempenho das simulações
+'''
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from data import MemData
+
+PREGOES_POR_ANO = 252
+
+
+def equity_curve(data: MemData, interval: List[str], capital: float,
+                 buy_log: List[Dict], sell_log: List[Dict]) -> Tuple[List[str], np.ndarray]:
+    """
+    Reconstrói o patrimônio diário (caixa + carteira a preço de mercado) de uma simulação
+    a partir do painel de cotações e dos logs de compra e venda, em uma única passada
+    vetorizada.
+
+    A quantidade de cada ativo em carteira é a soma acumulada das compras e vendas por
+    pregão; ativos sem cotação em um dia são avaliados pela última cotação conhecida.
+
+    :param data: Dados em memória usados na simulação.
+    :param interval: Lista com a data inicial e final da simulação.
+    :param capital: Capital inicial.
+    :param buy_log: Log de compras da simulação.
+    :param sell_log: Log de vendas da simulação.
+    :return: Tupla com os pregões do intervalo e o patrimônio ao fim de cada um.
+    """
+    pregoes = data.get_trading_days(*interval)
+    if not pregoes:
+        return pregoes, np.empty(0)
+
+    inicio = data.day_index[pregoes[0]]
+    fim = inicio + len(pregoes)
+    precos = pd.DataFrame(np.asarray(data.close_panel[inicio:fim])).ffill().to_numpy()
+    precos = np.nan_to_num(precos)
+
+    quantidades = np.zeros(precos.shape)
+    fluxo_caixa = np.zeros(len(pregoes))
+
+    if buy_log:
+        dias = np.array([data.day_index[item['data_compra']] for item in buy_log]) - inicio
+        ativos = np.array([data.symbol_index[item['simbolo']] for item in buy_log])
+        qtd = np.array([item['quantidade'] for item in buy_log], dtype=float)
+        valores = qtd * np.array([item['preco_compra'] for item in buy_log], dtype=float)
+        np.add.at(quantidades, (dias, ativos), qtd)
+        np.add.at(fluxo_caixa, dias, -valores)
+
+    if sell_log:
+        dias = np.array([data.day_index[item['data_venda']] for item in sell_log]) - inicio
+        ativos = np.array([data.symbol_index[item['simbolo']] for item in sell_log])
+        qtd = np.array([item['quantidade_vendida'] for item in sell_log], dtype=float)
+        valores = qtd * np.array([item['preco_venda'] for item in sell_log], dtype=float)
+        np.add.at(quantidades, (dias, ativos), -qtd)
+        np.add.at(fluxo_caixa, dias, valores)
+
+    carteira = np.cumsum(quantidades, axis=0)
+    caixa = capital + np.cumsum(fluxo_caixa)
+    return pregoes, caixa + (carteira * precos).sum(axis=1)
+
+
+def compute_metrics(data: MemData, interval: List[str], capital: float,
+                    buy_log: List[Dict], sell_log: List[Dict]) -> Dict[str, float]:
+    """
+    Calcula as métricas numéricas de uma simulação a partir da curva de patrimônio
+    (ver `equity_curve`) e dos logs.
+
+    :param data: Dados em memória usados na simulação.
+    :param interval: Lista com a data inicial e final da simulação.
+    :param capital: Capital inicial.
+    :param buy_log: Log de compras da simulação.
+    :param sell_log: Log de vendas da simulação.
+    :return: Dicionário com:
+             'patrimonio_final' (caixa + carteira a preço de mercado),
+             'retorno_mtm' (retorno total a preço de mercado, em fração),
+             'max_drawdown' (maior queda a partir de um pico, em fração positiva),
+             'volatilidade' e 'sharpe' (anualizados, a partir dos retornos diários, sem taxa livre de risco),
+             'turnover' (volume negociado / patrimônio médio, contando compras e vendas pela metade),
+             'taxa_acerto' (fração das vendas com lucro),
+             'n_compras' e 'n_vendas'.
+    """
+    _, patrimonio = equity_curve(data, interval, capital, buy_log, sell_log)
+
+    metricas = {
+        'patrimonio_final': float(capital),
+        'retorno_mtm': 0.0,
+        'max_drawdown': 0.0,
+        'volatilidade': 0.0,
+        'sharpe': float('nan'),
+        'turnover': 0.0,
+        'taxa_acerto': float('nan'),
+        'n_compras': len(buy_log),
+        'n_vendas': len(sell_log),
+    }
+    if len(patrimonio) == 0:
+        return metricas
+
+    curva = np.concatenate(([capital], patrimonio))
+    retornos = curva[1:] / curva[:-1] - 1
+    picos = np.maximum.accumulate(curva)
+
+    metricas['patrimonio_final'] = float(curva[-1])
+    metricas['retorno_mtm'] = float(curva[-1] / capital - 1)
+    metricas['max_drawdown'] = float(np.max(1 - curva / picos))
+
+    if len(retornos) > 1:
+        desvio = float(np.std(retornos, ddof=1))
+        metricas['volatilidade'] = float(desvio * np.sqrt(PREGOES_POR_ANO))
+        if desvio > 0:
+            metricas['sharpe'] = float(np.mean(retornos) / desvio * np.sqrt(PREGOES_POR_ANO))
+
+    negociado = sum(item['quantidade'] * item['preco_compra'] for item in buy_log) + \
+        sum(item['quantidade_vendida'] * item['preco_venda'] for item in sell_log)
+    metricas['turnover'] = float(negociado / 2 / np.mean(curva))
+
+    if sell_log:
+        metricas['taxa_acerto'] = float(
+            np.mean([item['lucro_prejuizo'] > 0 for item in sell_log]))
+
+    return metricas
@@ -0,0 +1,224 @@
+'''
+    class Portfolio
+'''
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class Portfolio:
+    """
+    Lotes de ativos em carteira, armazenados como arrays paralelos (um por atributo).
+
+    Cada lote guarda o índice do ativo no painel do MemData, a quantidade, o preço de
+    compra, o índice do dia de compra e o setor. O valor total investido (a preço de
+    compra) e o valor por setor são mantidos a cada compra e venda, sem reprocessar
+    a carteira inteira.
+    """
+
+    def __init__(self, sectors: Optional[List[str]] = None, capacity: int = 64,
+                 track_changes: bool = True):
+        """
+        Inicializa uma carteira vazia.
+
+        :param sectors: Setores conhecidos, na ordem dos identificadores (por exemplo,
+                        `MemData.sectors`). Setores novos são registrados por `sector_id`.
+        :param capacity: Quantidade inicial de lotes reservada nos arrays.
+        :param track_changes: Se False, as alterações não são guardadas para `pop_changes`
+                              (usado quando a timeline não é gravada).
+        """
+        self.track_changes = track_changes
+        self.size = 0
+        self.lot_ids = np.empty(capacity, dtype=np.int64)
+        self.symbol_ids = np.empty(capacity, dtype=np.int64)
+        self.quantities = np.empty(capacity, dtype=np.int64)
+        self.buy_prices = np.empty(capacity, dtype=float)
+        self.buy_days = np.empty(capacity, dtype=np.int64)
+        self.sector_ids = np.empty(capacity, dtype=np.int64)
+
+        self.sectors: List[str] = list(sectors or [])
+        self._sector_index: Dict[str, int] = {
+            sector: sector_id for sector_id, sector in enumerate(self.sectors)}
+        self.sector_values = np.zeros(len(self.sectors))
+        self.sector_lots = np.zeros(len(self.sectors), dtype=np.int64)
+
+        self.total_value = 0.0
+
+        # Alterações desde a última chamada de `pop_changes`
+        self._next_lot = 0
+        self._opened: List[int] = []
+        self._changed: Dict[int, int] = {}
+        self._closed: List[int] = []
+
+    def __len__(self):
+        return self.size
+
+    def sector_id(self, sector: str) -> int:
+        """
+        Retorna o identificador numérico de um setor, registrando-o se for novo.
+
+        :param sector: Nome do setor.
+        :return: Identificador do setor.
+        """
+        sector_id = self._sector_index.get(sector)
+        if sector_id is None:
+            sector_id = len(self.sectors)
+            self._sector_index[sector] = sector_id
+            self.sectors.append(sector)
+            self.sector_values = np.append(self.sector_values, 0.0)
+            self.sector_lots = np.append(self.sector_lots, 0)
+        return sector_id
+
+    def sector_weights(self) -> Dict[int, float]:
+        """
+        Retorna a fração do valor investido em cada setor presente na carteira.
+
+        :return: Dicionário com o identificador do setor como chave e a fração como valor.
+        """
+        if self.total_value <= 0:
+            return {}
+        return {
+            int(sector_id): self.sector_values[sector_id] / self.total_value
+            for sector_id in np.flatnonzero(self.sector_lots)
+        }
+
+    def add(self, symbol_id: int, quantity: int, price: float, day: int, sector_id: int) -> None:
+        """
+        Adiciona um lote ao final da carteira.
+
+        :param symbol_id: Índice do ativo no painel.
+        :param quantity: Quantidade comprada.
+        :param price: Preço de compra.
+        :param day: Índice do dia de compra no calendário do painel.
+        :param sector_id: Identificador do setor do ativo (ver `sector_id`).
+        """
+        if self.size == len(self.symbol_ids):
+            self._grow()
+
+        i = self.size
+        self.lot_ids[i] = self._next_lot
+        self.symbol_ids[i] = symbol_id
+        self.quantities[i] = quantity
+        self.buy_prices[i] = price
+        self.buy_days[i] = day
+        self.sector_ids[i] = sector_id
+        self.size += 1
+
+        if self.track_changes:
+            self._opened.append(self._next_lot)
+        self._next_lot += 1
+
+        value = quantity * price
+        self.total_value += value
+        self.sector_values[sector_id] += value
+        self.sector_lots[sector_id] += 1
+
+    def reduce(self, lots: np.ndarray, quantities: np.ndarray) -> None:
+        """
+        Retira quantidades de lotes existentes, removendo os lotes zerados
+        e preservando a ordem (FIFO) dos demais.
+
+        :param lots: Posições dos lotes na carteira.
+        :param quantities: Quantidade vendida de cada lote.
+        """
+        if len(lots) == 0:
+            return
+
+        values = quantities * self.buy_prices[lots]
+        self.quantities[lots] -= quantities
+        np.subtract.at(self.sector_values, self.sector_ids[lots], values)
+        for value in values.tolist():
+            self.total_value -= value
+
+        if self.track_changes:
+            for lot_id, quantity in zip(self.lot_ids[lots].tolist(), self.quantities[lots].tolist()):
+                if quantity > 0:
+                    self._changed[lot_id] = quantity
+                else:
+                    self._changed.pop(lot_id, None)
+                    self._closed.append(lot_id)
+
+        closed = lots[self.quantities[lots] <= 0]
+        if len(closed) == 0:
+            return
+
+        np.subtract.at(self.sector_lots, self.sector_ids[closed], 1)
+        self.sector_values[self.sector_lots == 0] = 0.0
+
+        keep = np.ones(self.size, dtype=bool)
+        keep[closed] = False
+        n = int(keep.sum())
+        for array in (self.lot_ids, self.symbol_ids, self.quantities, self.buy_prices,
+                      self.buy_days, self.sector_ids):
+            array[:n] = array[:self.size][keep]
+        self.size = n
+
+        if self.size == 0:
+            self.total_value = 0.0
+
+    def to_records(self, symbols: List[str], days: List[str]) -> List[Dict]:
+        """
+        Converte os lotes para a lista de dicionários usada nos resultados.
+
+        :param symbols: Símbolos dos ativos, na ordem do painel.
+        :param days: Datas (YYYY-MM-DD), na ordem do calendário do painel.
+        :return: Lista de lotes com símbolo, quantidade, preço e data de compra e setor.
+        """
+        return [self._record(i, symbols, days) for i in range(self.size)]
+
+    def pop_changes(self, symbols: List[str], days: List[str]) -> Dict[str, List]:
+        """
+        Retorna as alterações da carteira desde a chamada anterior e as descarta.
+
+        :param symbols: Símbolos dos ativos, na ordem do painel.
+        :param days: Datas (YYYY-MM-DD), na ordem do calendário do painel.
+        :return: Dicionário com as chaves presentes apenas quando há alterações:
+                 'opened' (lotes novos, com o identificador em 'lote'),
+                 'changed' (pares [lote, quantidade restante]) e
+                 'closed' (identificadores dos lotes encerrados).
+        """
+        changes = {}
+
+        opened = set(self._opened)
+        closed = [lot_id for lot_id in self._closed if lot_id not in opened]
+        changed = [[lot_id, quantity] for lot_id, quantity in self._changed.items()
+                   if lot_id not in opened]
+
+        if self._opened:
+            positions = np.searchsorted(self.lot_ids[:self.size], self._opened)
+            records = []
+            for lot_id, i in zip(self._opened, positions.tolist()):
+                if i < self.size and self.lot_ids[i] == lot_id:
+                    record = self._record(i, symbols, days)
+                    records.append({'lote': lot_id, **record})
+            if records:
+                changes['opened'] = records
+        if changed:
+            changes['changed'] = changed
+        if closed:
+            changes['closed'] = closed
+
+        self._opened = []
+        self._changed = {}
+        self._closed = []
+        return changes
+
+    def _record(self, i: int, symbols: List[str], days: List[str]) -> Dict:
+        """Converte o lote da posição `i` em dicionário."""
+        return {
+            'simbolo': symbols[self.symbol_ids[i]],
+            'quantidade': int(self.quantities[i]),
+            'preco_compra': float(self.buy_prices[i]),
+            'data_compra': days[self.buy_days[i]],
+            'sector': self.sectors[self.sector_ids[i]]
+        }
+
+    def _grow(self) -> None:
+        """Dobra a capacidade dos arrays de lotes."""
+        capacity = max(1, 2 * len(self.symbol_ids))
+        for name in ('lot_ids', 'symbol_ids', 'quantities', 'buy_prices', 'buy_days', 'sector_ids'):
+            array = getattr(self, name)
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            setattr(self, name, grown)
@@ -4,8 +4,10 @@ Ranker module for the investment strategy.
 """
 
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Dict, List
 import random
+import numpy as np
+import pandas as pd
 from data import MemData
 
 
@@ -82,6 +84,133 @@ def test_random_ranker():
     print("Símbolos ranqueados aleatoriamente:", ranked_symbols)
 
 
+class RollingMean:
+    """
+    Incremental moving average of a fixed window for many symbols at once.
+
+    Each symbol keeps a ring buffer with its last `window` quotes and a running sum of
+    them. As in pandas' `rolling(window).mean()`, NaN quotes take a place in the window
+    but are left out of the sum; the averages match pandas up to rounding.
+    """
+
+    def __init__(self, window: int, n_symbols: int):
+        """
+        :param window: Number of quotes in the average.
+        :param n_symbols: Number of symbols tracked.
+        """
+        self.window = window
+        self._buffer = np.full((window, n_symbols), np.nan)
+        self._count = np.zeros(n_symbols, dtype=np.int64)
+        self._sum = np.zeros(n_symbols)
+        self._nobs = np.zeros(n_symbols, dtype=np.int64)
+
+    def update(self, values: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        Adds a new quote to some symbols, in O(1) per symbol.
+
+        :param values: New quotes (may be NaN).
+        :param cols: Indices of the symbols receiving `values`.
+        :return: Moving averages of those symbols (NaN while the window has fewer than
+            `window` non-NaN quotes).
+        """
+        pos = self._count[cols] % self.window
+        old = self._buffer[pos, cols]
+        old_counted = ~np.isnan(old)
+        new_counted = ~np.isnan(values)
+
+        self._sum[cols] += np.where(new_counted, values, 0.0) - np.where(old_counted, old, 0.0)
+        self._nobs[cols] += new_counted.astype(np.int64) - old_counted
+        self._buffer[pos, cols] = values
+        self._count[cols] += 1
+
+        nobs = self._nobs[cols]
+        mean = np.full(len(cols), np.nan)
+        ready = nobs >= self.window
+        mean[ready] = self._sum[cols][ready] / nobs[ready]
+        return mean
+
+
+def crossover_strength(prev_short: np.ndarray, prev_long: np.ndarray,
+                       short: np.ndarray, long: np.ndarray) -> np.ndarray:
+    """
+    Strength of the moving average crossover: how far, in percent, the short average
+    is above the long one on the day it crosses it upwards.
+
+    :param prev_short: Short moving average on the previous bar.
+    :param prev_long: Long moving average on the previous bar.
+    :param short: Short moving average on the bar.
+    :param long: Long moving average on the bar.
+    :return: Strength of each symbol, -inf where there is no crossover (or a NaN average).
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        crossed = (prev_short <= prev_long) & (short > long)
+        return np.where(crossed, (short / long - 1) * 100, float('-inf'))
+
+
+class MACrossover:
+    """
+    Moving average crossover signal of every symbol, updated one day at a time.
+
+    Follows new quotes as they arrive (IncrementalMARanker), giving the same signal
+    as the rolling means precomputed by MARanker.
+    """
+
+    def __init__(self, n_symbols: int, short: int, long: int):
+        """
+        :param n_symbols: Number of symbols tracked.
+        :param short: Window of the short moving average.
+        :param long: Window of the long moving average.
+        """
+        self._short = RollingMean(short, n_symbols)
+        self._long = RollingMean(long, n_symbols)
+        self._prev_short = np.full(n_symbols, np.nan)
+        self._prev_long = np.full(n_symbols, np.nan)
+
+    def update(self, closes: np.ndarray, bars: np.ndarray = None) -> np.ndarray:
+        """
+        Adds the quotes of a new day.
+
+        The moving averages of each symbol run over its own bars only, so days
+        without a bar do not break the windows.
+
+        :param closes: Close of every symbol on the day.
+        :param bars: Whether each symbol has a bar on the day (see `MemData.bar_panel`);
+            by default, the symbols whose close is not NaN.
+        :return: Crossover strength of every symbol. NaN means the symbol has no bar
+            on that day, -inf means no crossover (or a NaN close).
+        """
+        strength = np.full(len(closes), np.nan)
+        if bars is None:
+            bars = ~np.isnan(closes)
+        cols = np.flatnonzero(bars)
+        if len(cols) == 0:
+            return strength
+
+        values = np.asarray(closes, dtype=float)[cols]
+        short = self._short.update(values, cols)
+        long = self._long.update(values, cols)
+
+        strength[cols] = crossover_strength(self._prev_short[cols], self._prev_long[cols],
+                                            short, long)
+
+        self._prev_short[cols] = short
+        self._prev_long[cols] = long
+        return strength
+
+
+def rank_strength(strength: np.ndarray, symbols: np.ndarray) -> List[str]:
+    """
+    Sorts the symbols with a quote by decreasing strength (ties keep the symbol order).
+
+    :param strength: Strength of every symbol, NaN for symbols without a quote.
+    :param symbols: Symbols, in the same order as `strength`.
+    :return: Ranked symbols.
+    """
+    available = ~np.isnan(strength)
+    order = np.argsort(-strength[available], kind='stable')
+    return symbols[available][order].tolist()
+
+
 class MARanker(Ranker):
     """Mean Reversion Ranker class"""
 
@@ -90,40 +219,144 @@ class MARanker(Ranker):
         windows = self.parameters.get("window")
         self._short = windows[0]
         self._long = windows[1]
+        self.strength = self._compute_strength()
+        self._rankings = self._compute_rankings()
+
+    def _compute_strength(self) -> pd.DataFrame:
+        """
+        Computes the crossover strength of every symbol for every date, once.
+
+        The moving averages of each symbol run over its own bars only, so days
+        without a bar do not break the rolling windows: the bars of every symbol are
+        moved to the top of its column, the whole panel goes through a single pandas
+        rolling mean per window, and the result is moved back to the bar dates.
+
+        :return: DataFrame indexed by date (YYYY-MM-DD) with one column per symbol.
+            NaN means the symbol has no bar on that date, -inf means no crossover.
+        """
+        panel = np.asarray(self.data.close_panel, dtype=float)
+        bars = np.asarray(self.data.bar_panel, dtype=bool)
+
+        # Row of the n-th bar of each symbol (rows without a bar go to the bottom)
+        order = np.argsort(~bars, axis=0, kind='stable')
+        compact = np.take_along_axis(panel, order, axis=0)
+        compact[np.arange(len(panel))[:, None] >= bars.sum(axis=0)] = np.nan
+
+        close = pd.DataFrame(compact)
+        short = close.rolling(self._short).mean()
+        long = close.rolling(self._long).mean()
+
+        compact_strength = crossover_strength(short.shift(1).to_numpy(), long.shift(1).to_numpy(),
+                                              short.to_numpy(), long.to_numpy())
+
+        strength = np.empty(panel.shape)
+        np.put_along_axis(strength, order, compact_strength, axis=0)
+        strength[~bars] = np.nan
+
+        return pd.DataFrame(strength, index=self.data.trading_days,
+                            columns=self.data.get_assets())
+
+    def _compute_rankings(self) -> Dict[str, List[str]]:
+        """
+        Sorts the symbols of every date by strength, so `rank` is a lookup.
+
+        :return: Dictionary with the date (YYYY-MM-DD) as key and ranked symbols as value.
+        """
+        symbols = np.array(self.strength.columns)
+        values = self.strength.to_numpy(dtype=float)
+        return {date: rank_strength(row, symbols)
+                for date, row in zip(self.strength.index, values)}
 
     def rank(self, date: str = None) -> List[str]:
-        dict_data = self.data.get_all_history()
-        ranked_symbols = []
-        for symbol, df_data in dict_data.items():
-            # Calculate means
-            short = 'w' + str(self._short)
-            long = 'w' + str(self._long)
-            df_data[short] = df_data['Close'].rolling(self._short).mean()
-            df_data[long] = df_data['Close'].rolling(self._long).mean()
-            # Default strength is negative infinity
-            strength = float('-inf')
-
-            if date in df_data.index:
-                idx = df_data.index.get_loc(date)
-
-                if isinstance(idx, slice):
-                    idx = idx.start  # ou idx.stop
-
-                # Verifique se o índice é válido (>= 1)
-                if idx >= 1:
-                    latest = df_data.iloc[idx]
-                    prev = df_data.iloc[idx-1]
-                    # Check for mean reversion
-                    if prev[short] <= prev[long] and latest[short] > latest[long]:
-                        # Calculate strength
-                        strength = (latest[short] / latest[long] - 1) * 100
-            else:
-                continue
-
-            ranked_symbols.append((symbol, strength))
-
-        ranked_symbols.sort(key=lambda x: x[1], reverse=True)
-        return [x[0] for x in ranked_symbols]
+        return list(self._rankings.get(date, []))
+
+
+class IncrementalMARanker(Ranker):
+    """
+    Moving average crossover ranker for online use: the state is advanced one bar at
+    a time in O(symbols), instead of recomputing the whole history. Its rankings are
+    the same as MARanker's.
+    """
+
+    def __init__(self, parameters: dict = None, interval: List[str] = None, data: MemData = None):
+        super().__init__(parameters, interval, data)
+        windows = self.parameters.get("window")
+        self._symbols = np.array(self.data.get_assets())
+        self._crossover = MACrossover(len(self._symbols), windows[0], windows[1])
+        self.last_date: str = None
+        self._ranking: List[str] = []
+
+    def update(self, date: str, closes: np.ndarray, bars: np.ndarray = None) -> List[str]:
+        """
+        Adds a new bar and ranks the symbols on it.
+
+        :param date: Date of the bar (YYYY-MM-DD), after the last bar added.
+        :param closes: Close of every symbol, aligned with `data.symbol_index`
+            (NaN when there is no quote).
+        :param bars: Whether each symbol has a bar on the date (see `MACrossover.update`).
+        :return: Ranked symbols.
+        """
+        if self.last_date is not None and date <= self.last_date:
+            raise ValueError(f"Bar {date} is not after the last bar ({self.last_date}).")
+
+        strength = self._crossover.update(closes, bars)
+        self.last_date = date
+        self._ranking = rank_strength(strength, self._symbols)
+        return list(self._ranking)
+
+    def rank(self, date: str = None) -> List[str]:
+        """
+        Ranks the symbols on a date, first adding the trading days of `data` up to it.
+
+        :param date: Date (YYYY-MM-DD); if None, the ranking of the last bar is returned.
+        :return: Ranked symbols, or an empty list if `date` is not a trading day (or
+            `data` has no trading days).
+        """
+        if date is None or date == self.last_date:
+            return list(self._ranking)
+        if self.last_date is not None and date < self.last_date:
+            raise ValueError(f"Cannot rank {date} after advancing to {self.last_date}.")
+        if len(self.data.trading_days) == 0:
+            return []
+
+        start = self.data.trading_days[0] if self.last_date is None else self.last_date
+        for day in self.data.get_trading_days(start, date):
+            if day != self.last_date:
+                row = self.data.day_index[day]
+                self.update(day, self.data.close_panel[row], self.data.bar_panel[row])
+
+        if date != self.last_date:
+            return []
+        return list(self._ranking)
+
+
+class CachedRanker(Ranker):
+    """
+    Ranker that replays the rankings computed once by another ranker,
+    so several runs with the same ranker configuration share that work.
+    """
+
+    def __init__(self, ranker: Ranker, dates: List[str]):
+        """
+        Computes and stores the ranking of `ranker` for every date.
+
+        :param ranker: Ranker instance whose rankings are cached. Its `rank` must
+            depend only on the date.
+        :param dates: Dates (YYYY-MM-DD) to rank, usually the trading days of a run.
+        """
+        super().__init__(ranker.parameters, ranker.interval, ranker.data)
+        self._symbols = self.data.get_assets()
+        index = {symbol: i for i, symbol in enumerate(self._symbols)}
+        self._rankings = {
+            date: np.array([index[symbol] for symbol in ranker.rank(date)], dtype=np.int32)
+            for date in dates
+        }
+
+    def rank(self, date: str = None) -> List[str]:
+        ranking = self._rankings.get(date)
+        if ranking is None:
+            return []
+        return [self._symbols[i] for i in ranking]
 
 
 def test_ma_ranker():
@@ -141,5 +374,42 @@ def test_ma_ranker():
     print("Símbolos ranqueados por Mean Reversion:", ranked_symbols)
 
 
+def test_incremental_ma_ranker():
+    """
+    Confere, em dados sintéticos, se o IncrementalMARanker, avançando um pregão por
+    vez, gera a mesma força (a menos de arredondamento) e os mesmos rankings que o
+    MARanker (pré-calculado com as médias móveis do pandas), e se o RollingMean
+    acompanha o rolling do pandas.
+    """
+    from data import synthetic_mem_data  # pylint: disable=import-outside-toplevel
+
+    data = synthetic_mem_data()
+
+    for window in ([5, 20], [9, 21]):
+        parameters = {"window": window}
+        ranker = MARanker(data=data, parameters=parameters)
+        incremental = IncrementalMARanker(data=data, parameters=parameters)
+        crossover = MACrossover(len(data.get_assets()), *window)
+
+        for row, date in enumerate(data.trading_days):
+            strength = crossover.update(data.close_panel[row], data.bar_panel[row])
+            assert np.allclose(strength, ranker.strength.iloc[row].to_numpy(),
+                               equal_nan=True), date
+            assert incremental.rank(date) == ranker.rank(date), date
+
+    for col, symbol in enumerate(data.get_assets()):
+        close = pd.Series(data.close_panel[data.bar_panel[:, col], col])
+        for window in (5, 20):
+            expected = close.rolling(window).mean().to_numpy()
+            rolling = RollingMean(window, 1)
+            means = [rolling.update(np.array([value]), np.array([0]))[0] for value in close]
+            assert np.allclose(means, expected, equal_nan=True), symbol
+
+    empty = IncrementalMARanker(data=MemData.from_histories({}), parameters={"window": [5, 20]})
+    assert empty.rank("2024-01-02") == []
+
+    print("IncrementalMARanker igual ao MARanker em", len(data.trading_days), "pregões")
+
+
 if __name__ == "__main__":
     test_ma_ranker()
@@ -0,0 +1,129 @@
+'''
+    Armazenamento local dos resultados de cada combinação do backtesting
+'''
+
+import hashlib
+import json
+import os
+from typing import Dict, Optional
+
+from files import file_path
+from utils import convert_numpy
+
+SUB_DIR_RESULTS = "grid_results"
+
+# Versão do formato dos resultados gravados: aumente sempre que os campos do resumo
+# (ver `Backtesting._evaluate_results`) ou a simulação mudarem, para descartar os antigos
+RESULT_VERSION = 1
+
+
+def result_key(runner_params: Dict, ranker_cls: type, ranker_params: Dict, interval, market: str,
+               data_version: str, capital: float) -> str:
+    """
+    Gera a chave de uma combinação do backtesting.
+
+    :param runner_params: Parâmetros do Runner.
+    :param ranker_cls: Classe do ranker.
+    :param ranker_params: Parâmetros do ranker.
+    :param interval: Lista com a data inicial e final da simulação.
+    :param market: Mercado dos dados.
+    :param data_version: Versão dos dados carregados (ver `MemData.version`).
+    :param capital: Capital inicial da simulação.
+    :return: Hash hexadecimal da combinação (inclui `RESULT_VERSION`).
+    """
+    conteudo = json.dumps({
+        'version': RESULT_VERSION,
+        'runner': runner_params,
+        'ranker': f"{ranker_cls.__module__}.{ranker_cls.__qualname__}",
+        'ranker_params': ranker_params,
+        'interval': list(interval),
+        'market': market,
+        'data': data_version,
+        'capital': capital,
+    }, sort_keys=True, default=convert_numpy)
+    return hashlib.sha1(conteudo.encode()).hexdigest()
+
+
+class ResultStore:
+    """
+    Resultados já calculados, um arquivo JSON por chave (ver `result_key`), gravados
+    assim que cada combinação termina para que uma execução interrompida possa ser retomada.
+    """
+
+    def __init__(self, subdir: str = SUB_DIR_RESULTS):
+        """
+        :param subdir: Subdiretório do cache onde os resultados são gravados.
+        """
+        self.subdir = subdir
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Retorna o resultado gravado de uma chave.
+
+        :param key: Chave da combinação.
+        :return: Resultado, ou None se a combinação ainda não foi calculada.
+        """
+        nome = file_path(f"{key}.json", self.subdir)
+        if not os.path.isfile(nome):
+            return None
+        with open(nome, 'r', encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+
+    def put(self, key: str, result: Dict) -> None:
+        """
+        Grava o resultado de uma chave (substituindo o arquivo de uma vez, para que uma
+        interrupção não deixe um resultado pela metade).
+
+        :param key: Chave da combinação.
+        :param result: Resultado (resumo) da combinação.
+        """
+        nome = file_path(f"{key}.json", self.subdir)
+        temporario = nome + '.part'
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump(result, arquivo, ensure_ascii=False, default=convert_numpy)
+        os.replace(temporario, nome)
+
+
+def test_result_key():
+    """
+    Confere que o mesmo resultado é encontrado com as mesmas entradas e que mudar o
+    capital, qualquer outro parâmetro ou a versão dos resultados não reaproveita o cache.
+    """
+    import shutil  # pylint: disable=import-outside-toplevel
+
+    base = {
+        'runner_params': {'profit': 0.1, 'loss': 0.05, 'diversification': 0.2},
+        'ranker_cls': ResultStore,
+        'ranker_params': {'window': [9, 21]},
+        'interval': ['2024-01-01', '2024-12-31'],
+        'market': 'IBOV',
+        'data_version': 'abc',
+        'capital': 20000,
+    }
+    store = ResultStore(subdir=f"test_{SUB_DIR_RESULTS}_{os.getpid()}")
+
+    try:
+        store.put(result_key(**base), {'caixa_final': 16363.86})
+        assert store.get(result_key(**base)) == {'caixa_final': 16363.86}
+
+        for campo, valor in (('capital', 50000), ('interval', ['2024-01-01', '2024-06-30']),
+                             ('runner_params', {**base['runner_params'], 'profit': 0.15}),
+                             ('ranker_params', {'window': [20, 50]}), ('market', 'IBRA'),
+                             ('data_version', 'def')):
+            assert store.get(result_key(**{**base, campo: valor})) is None, campo
+
+        global RESULT_VERSION  # pylint: disable=global-statement
+        versao = RESULT_VERSION
+        RESULT_VERSION += 1
+        try:
+            assert store.get(result_key(**base)) is None, 'RESULT_VERSION'
+        finally:
+            RESULT_VERSION = versao
+    finally:
+        shutil.rmtree(file_path("", store.subdir), ignore_errors=True)
+
+    print("Chaves do cache de resultados conferidas")
+
+
+if __name__ == "__main__":
+    test_result_key()
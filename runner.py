@@ -2,23 +2,37 @@
     class Runner
 '''
 
-from typing import List, Dict, Type
+from typing import List, Dict, Optional, Type, Union
 
-from datetime import datetime
+import numpy as np
 import pandas as pd
 from ranker import MARanker, Ranker, RandomRanker
 from data import MemData
+from metrics import compute_metrics
+from accumulators import Accumulator, Step, default_accumulators
+from portfolio import Portfolio
+
+
+def _volume(volume: float):
+    """
+    Converte o volume do painel (float, por causa do NaN) para inteiro.
+
+    :param volume: Volume diário lido do painel.
+    :return: Volume inteiro, ou NaN se não houver negociação registrada.
+    """
+    return volume if np.isnan(volume) else int(volume)
 
 
 class Runner:
-    def __init__(self, profit, loss, diversification, ranker: Type[Ranker], data: MemData):
+    def __init__(self, profit, loss, diversification, ranker: Union[Type[Ranker], Ranker], data: MemData):
         """
         Inicializa a classe Runner com os parâmetros fornecidos.
 
         :param profit: Lucro alvo para venda (porcentagem).
         :param loss: Limite de perda para venda (porcentagem).
         :param diversification: Porcentagem máxima para cada setor (porcentagem).
-        :param ranker: Classe do ranker a ser utilizada.
+        :param ranker: Classe do ranker a ser utilizada, ou uma instância já construída
+                       (por exemplo, um CachedRanker compartilhado entre execuções).
         """
         self.profit = profit
         self.loss = loss
@@ -27,41 +41,128 @@ class Runner:
         self.ranker = ranker
 
         # representando as ações compradas (símbolo, quantidade, preço médio, etc.)
-        self.__portfolio: List[Dict[str, float]] = []
+        self.__portfolio = Portfolio(data.sectors)
 
         self.data = data
 
         self.balance = 0
 
         self.timeline = []
+        self.sell_log = []
+        self.buy_log = []
 
-    def single_run(self, interval: List[str], ranker_conf: Dict[str, float], capital: float) -> Dict:
+        # Estado da simulação em andamento (ver `start` e `advance`)
+        self._datas: List[str] = []
+        self._cursor = 0
+        self._accumulators: Optional[List[Accumulator]] = None
+
+    def single_run(self, interval: List[str], ranker_conf: Dict[str, float], capital: float,
+                   calendar_days: bool = False, keep_timeline: bool = True,
+                   accumulators: Optional[List[Accumulator]] = None) -> Dict:
         """
         Executa uma simulação para uma única configuração de ranker, 
         mantendo o portfólio com a quantidade e o preço de compra dos ativos.
 
+        A simulação percorre apenas os dias de pregão do mercado carregado em `data`.
+
         :param interval: Lista com a data inicial e final da simulação.
-        :param ranker_conf: Configuração do ranker a ser utilizada.
+        :param ranker_conf: Configuração do ranker a ser utilizada (ignorada se o Runner
+                            recebeu uma instância de ranker).
         :param capital: Capital inicial.
+        :param calendar_days: Se True, a timeline também recebe os dias sem pregão,
+                              repetindo o estado do último pregão.
+        :param keep_timeline: Se False, a timeline não é gravada (fica vazia).
+        :param accumulators: Acumuladores atualizados ao fim de cada pregão (ver
+                             `accumulators.default_accumulators`); suas métricas são
+                             retornadas em 'stats'.
         :return: Estado final do portfólio.
         """
+        self.start(interval, ranker_conf, capital, calendar_days=calendar_days,
+                   keep_timeline=keep_timeline, accumulators=accumulators)
+        self.advance(interval[1])
+        return self.result()
+
+    def start(self, interval: List[str], ranker_conf: Dict[str, float], capital: float,
+              calendar_days: bool = False, keep_timeline: bool = True,
+              accumulators: Optional[List[Accumulator]] = None) -> None:
+        """
+        Prepara uma simulação sem executá-la; os dias são percorridos por `advance`,
+        que pode ser chamado várias vezes para continuar a simulação de onde parou.
 
-        ranker = self.ranker(parameters=ranker_conf, data=self.data)
+        Os parâmetros são os mesmos de `single_run`.
+        """
+        if isinstance(self.ranker, Ranker):
+            self._ranker_ativo = self.ranker
+        else:
+            self._ranker_ativo = self.ranker(parameters=ranker_conf, data=self.data)
 
         start_date, end_date = interval
 
         self.balance = capital
-        self.__portfolio = []
-        shared_data = {}
-
+        self.__portfolio = Portfolio(self.data.sectors, track_changes=keep_timeline)
+        self.timeline = []
         self.sell_log = []
         self.buy_log = []
 
-        for date in pd.date_range(start_date, end_date).strftime('%Y-%m-%d'):
-            self._sell(date)
-            self._buy(date, ranker)
-            self._record_state(date)
+        self._keep_timeline = keep_timeline
+        self._accumulators = accumulators
+        for acumulador in accumulators or []:
+            acumulador.start(capital)
+        self._ultimos_precos = np.zeros(len(self.data.get_assets()))
+
+        pregoes = self.data.get_trading_days(start_date, end_date)
+
+        if calendar_days:
+            self._datas = list(pd.date_range(start_date, end_date).strftime('%Y-%m-%d'))
+        else:
+            self._datas = pregoes
+        self._pregoes = set(pregoes)
+        self._cursor = 0
+
+    def attach(self, data: MemData, ranker: Ranker) -> None:
+        """
+        Volta a apontar um Runner copiado (por exemplo, na volta de um processo do
+        joblib) para os dados e o ranker compartilhados, descartando as cópias.
+
+        :param data: Dados usados pelo Runner original.
+        :param ranker: Instância de ranker recebida pelo Runner original.
+        """
+        self.data = data
+        self.ranker = ranker
+        self._ranker_ativo = ranker
+
+    def advance(self, end_date: str) -> None:
+        """
+        Continua a simulação preparada por `start` até uma data (inclusive).
 
+        :param end_date: Última data a simular (YYYY-MM-DD); datas após o fim do
+                         intervalo são ignoradas.
+        """
+        accumulators = self._accumulators
+        while self._cursor < len(self._datas) and self._datas[self._cursor] <= end_date:
+            date = self._datas[self._cursor]
+            if date in self._pregoes:
+                vendas, compras = len(self.sell_log), len(self.buy_log)
+                self._sell(date)
+                self._buy(date, self._ranker_ativo)
+                if accumulators:
+                    self._accumulate(date, accumulators, self._ultimos_precos, vendas, compras)
+            if self._keep_timeline:
+                self._record_state(date)
+            self._cursor += 1
+
+    @property
+    def current_date(self) -> Optional[str]:
+        """Última data simulada, ou None se a simulação ainda não começou."""
+        return self._datas[self._cursor - 1] if self._cursor else None
+
+    def result(self) -> Dict:
+        """
+        Retorna o estado da simulação até a última data percorrida por `advance`.
+
+        :return: Dicionário com 'balance', 'portfolio', 'shared_data' (timeline e
+                 parâmetros), 'sell_log', 'buy_log' e, se houver acumuladores, 'stats'.
+        """
         shared_data = {
             'timeline': self.timeline,
             'profit': self.profit,
@@ -69,13 +170,44 @@ class Runner:
             'diversification': self.diversification
         }
 
-        return {
+        resultado = {
             'balance': self.balance,
-            'portfolio': self.__portfolio,
+            'portfolio': self.get_portfolio(),
             'shared_data': shared_data,
             'sell_log': self.sell_log,
             'buy_log': self.buy_log
         }
+        if self._accumulators is not None:
+            resultado['stats'] = {
+                chave: valor for acumulador in self._accumulators
+                for chave, valor in acumulador.result().items()
+            }
+        return resultado
+
+    def _accumulate(self, date: str, accumulators: List[Accumulator], ultimos_precos: np.ndarray,
+                    vendas: int, compras: int):
+        """
+        Atualiza os acumuladores com o estado ao fim de um pregão.
+
+        :param date: Data do pregão.
+        :param accumulators: Acumuladores da simulação.
+        :param ultimos_precos: Última cotação conhecida de cada ativo (atualizada aqui).
+        :param vendas: Tamanho do log de vendas antes do pregão.
+        :param compras: Tamanho do log de compras antes do pregão.
+        """
+        cotacoes = self.data.get_day(date)
+        if cotacoes is not None:
+            np.copyto(ultimos_precos, cotacoes[0], where=~np.isnan(cotacoes[0]))
+
+        carteira = self.__portfolio
+        n = carteira.size
+        patrimonio = self.balance + float(
+            np.dot(carteira.quantities[:n], ultimos_precos[carteira.symbol_ids[:n]]))
+
+        passo = Step(date, self.balance, patrimonio, carteira, ultimos_precos,
+                     self.buy_log[compras:], self.sell_log[vendas:])
+        for acumulador in accumulators:
+            acumulador.update(passo)
 
     def _sell(self, date: str):
         """
@@ -84,67 +216,53 @@ class Runner:
 
         :param date: Data atual para verificar se algum ativo atendeu ao critério de venda.
         """
-        dados_historicos = self.data.get_all_history()
-
-        historicos_ativos = {}
-
-        for simbolo in [item['simbolo'] for item in self.__portfolio]:
-            historico = dados_historicos.get(simbolo)
-            if historico is not None and not historico.empty:
-                historico_data = historico.loc[
-                    historico.index.date == datetime.strptime(
-                        date, '%Y-%m-%d').date()
-                ]
-                if not historico_data.empty:
-                    historicos_ativos[simbolo] = {
-                        'preco_atual': historico_data['Close'].iloc[0],
-                        'volume_diario': historico_data['Volume'].iloc[0]
-                    }
-
-        novos_portfolio = []
-        for item in self.__portfolio:
-            simbolo = item['simbolo']
-            preco_compra = item['preco_compra']
-            quantidade = item['quantidade']
-            data_compra = item['data_compra']
-
-            if simbolo not in historicos_ativos:
-                novos_portfolio.append(item)
-                continue
+        carteira = self.__portfolio
+        if len(carteira) == 0:
+            return
 
-            preco_atual = historicos_ativos[simbolo]['preco_atual']
-            volume_diario = historicos_ativos[simbolo]['volume_diario']
+        cotacoes = self.data.get_day(date)
+        if cotacoes is None:
+            return
 
-            percentual_variacao = (preco_atual - preco_compra) / preco_compra
+        precos, volumes = cotacoes
 
-            if percentual_variacao >= self.profit or percentual_variacao <= -self.loss:
-                quantidade_vender = min(quantidade, volume_diario)
-                valor_venda = preco_atual * quantidade_vender
-                self.balance += valor_venda
+        n = carteira.size
+        ativos = carteira.symbol_ids[:n]
+        precos_compra = carteira.buy_prices[:n]
+        precos_atuais = precos[ativos]
 
-                self.sell_log.append({
-                    'data_venda': date,
-                    'simbolo': simbolo,
-                    'quantidade_vendida': quantidade_vender,
-                    'preco_compra': preco_compra,
-                    'preco_venda': preco_atual,
-                    'lucro_prejuizo': (preco_atual - preco_compra) * quantidade_vender,
-                    'data_compra': data_compra
-                })
+        percentual_variacao = (precos_atuais - precos_compra) / precos_compra
+        lotes = np.flatnonzero(
+            (percentual_variacao >= self.profit) | (percentual_variacao <= -self.loss))
 
-                if quantidade > quantidade_vender:
-                    novos_portfolio.append({
-                        'simbolo': simbolo,
-                        'quantidade': quantidade - quantidade_vender,
-                        'preco_compra': preco_compra,
-                        'data_compra': data_compra,
-                        'sector': item['sector']
-                    })
+        if len(lotes) == 0:
+            return
 
-            else:
-                novos_portfolio.append(item)
+        assets = self.data.get_assets()
+        vendidas = np.empty(len(lotes), dtype=np.int64)
+
+        for i, lote in enumerate(lotes):
+            preco_atual = precos_atuais[lote]
+            preco_compra = precos_compra[lote]
+            quantidade = int(carteira.quantities[lote])
+            volume_diario = _volume(volumes[ativos[lote]])
+
+            quantidade_vender = min(quantidade, volume_diario)
+            valor_venda = preco_atual * quantidade_vender
+            self.balance += valor_venda
+            vendidas[i] = quantidade_vender
+
+            self.sell_log.append({
+                'data_venda': date,
+                'simbolo': assets[ativos[lote]],
+                'quantidade_vendida': quantidade_vender,
+                'preco_compra': preco_compra,
+                'preco_venda': preco_atual,
+                'lucro_prejuizo': (preco_atual - preco_compra) * quantidade_vender,
+                'data_compra': self.data.trading_days[carteira.buy_days[lote]]
+            })
 
-        self.__portfolio = novos_portfolio
+        carteira.reduce(lotes, vendidas)
 
     def _buy(self, date: str, ranker: Ranker):
         """
@@ -159,30 +277,19 @@ class Runner:
         if not ranked_symbols:
             return
 
-        dados_historicos = self.data.get_all_history()
-        todas_infos = self.data.get_all_info()
-
-        total_portfolio_value = sum(
-            item['preco_compra'] * item['quantidade'] for item in self.__portfolio
-        )
-
-        setor_percentual = {}
-
-        if total_portfolio_value > 0:
-            for item in self.__portfolio:
-                setor = item.get('sector')
-                preco_compra = item.get('preco_compra', 0)
-                quantidade = item.get('quantidade', 0)
+        cotacoes = self.data.get_day(date)
+        if cotacoes is None:
+            return
 
-                if not setor:
-                    print(f"Setor não encontrado para o símbolo {
-                          item['simbolo']}.")
-                    continue
+        precos, volumes = cotacoes
+        dia = self.data.day_index[date]
+        setores = self.data.sector_ids
+        nomes_setores = self.data.sectors
+        carteira = self.__portfolio
 
-                valor_item = preco_compra * quantidade
+        total_portfolio_value = carteira.total_value
 
-                setor_percentual[setor] = setor_percentual.get(
-                    setor, 0) + (valor_item / total_portfolio_value)
+        setor_percentual = carteira.sector_weights()
 
         balance_disponivel = self.balance
 
@@ -190,33 +297,25 @@ class Runner:
             if balance_disponivel <= 2:  # Valor mínimo para comprar uma ação, mudar depois
                 break
 
-            ativo_info = todas_infos.get(simbolo)
-            if ativo_info is None or ativo_info.empty:
+            indice = self.data.symbol_index.get(simbolo)
+            if indice is None:
+                continue
+
+            id_setor = int(setores[indice])
+            if id_setor < 0:  # ativo sem informação de setor
                 continue
 
-            setor = ativo_info.iloc[0]['sector']
+            setor = nomes_setores[id_setor]
 
             max_investimento_setor = (
-                balance_disponivel * self.diversification if setor not in setor_percentual
+                balance_disponivel * self.diversification if id_setor not in setor_percentual
                 else total_portfolio_value * self.diversification -
-                setor_percentual.get(setor, 0) * total_portfolio_value
+                setor_percentual.get(id_setor, 0) * total_portfolio_value
             )
 
-            historico = dados_historicos.get(simbolo)
-            if historico is None or historico.empty:
-                continue
-
-            historico_data = historico.loc[
-                historico.index.date == datetime.strptime(
-                    date, '%Y-%m-%d').date()
-            ]
-
-            if historico_data.empty:
-                continue
-
-            preco_atual = historico_data['Close'].iloc[0]
+            preco_atual = precos[indice]
 
-            volume_diario = historico_data['Volume'].iloc[0]
+            volume_diario = _volume(volumes[indice])
 
             if pd.isna(preco_atual) or pd.isna(volume_diario):
                 continue
@@ -237,41 +336,38 @@ class Runner:
                 'sector': setor
             })
 
-            self.__portfolio.append({
-                'simbolo': simbolo,
-                'quantidade': quantidade_comprar,
-                'preco_compra': preco_atual,
-                'data_compra': date,
-                'sector': setor
-            })
+            carteira.add(indice, quantidade_comprar, preco_atual, dia, id_setor)
 
             balance_disponivel -= quantidade_comprar * preco_atual
             total_portfolio_value += quantidade_comprar * preco_atual
-            setor_percentual[setor] = setor_percentual.get(setor, 0) + (
+            setor_percentual[id_setor] = setor_percentual.get(id_setor, 0) + (
                 quantidade_comprar * preco_atual / total_portfolio_value
             )
 
         self.balance = balance_disponivel
 
+    def get_portfolio(self) -> List[Dict]:
+        """
+        Retorna os lotes em carteira como lista de dicionários.
+
+        :return: Lista de lotes com símbolo, quantidade, preço e data de compra e setor.
+        """
+        return self.__portfolio.to_records(self.data.get_assets(), self.data.trading_days)
+
     def _record_state(self, date):
         """
-        Grava o estado completo do portfólio e saldo em uma data específica,
+        Grava o saldo e as alterações do portfólio em uma data específica.
+
+        Apenas os lotes abertos, alterados ou encerrados desde o registro anterior são
+        gravados; o estado completo de qualquer dia pode ser reconstruído com
+        `timeline.replay` ou `timeline.state_at`.
 
         :param date: Data atual da simulação.
         """
         self.timeline.append({
             'date': date,
             'balance': float(self.balance),
-            'portfolio': [
-                {
-                    'simbolo': item['simbolo'],
-                    'quantidade': int(item['quantidade']),
-                    'preco_compra': float(item['preco_compra']),
-                    'data_compra': item['data_compra'],
-                    'sector': item['sector']
-                }
-                for item in self.__portfolio
-            ]
+            **self.__portfolio.pop_changes(self.data.get_assets(), self.data.trading_days)
         })
 
 
@@ -318,5 +414,30 @@ def test_runner_ma():
         print(f"Erro durante o teste: {e}")
 
 
+def test_runner_accumulators():
+    interval = ["2024-04-10", "2024-08-10"]
+
+    ranker_config = {"window": [9, 21]}
+
+    data = MemData(interval)
+    runner = Runner(
+        profit=0.1,
+        loss=0.05,
+        diversification=0.2,
+        ranker=MARanker,
+        data=data
+    )
+
+    result = runner.single_run(interval, ranker_config, capital=10000,
+                               keep_timeline=False, accumulators=default_accumulators())
+
+    metricas = compute_metrics(data, interval, 10000, result['buy_log'], result['sell_log'])
+    for chave, valor in metricas.items():
+        assert np.isclose(result['stats'][chave], valor, equal_nan=True), chave
+
+    assert not result['shared_data']['timeline']
+    print("Métricas acumuladas:", result['stats'])
+
+
 if __name__ == "__main__":
     test_runner_ma()
@@ -0,0 +1,65 @@
+'''
+    Timeline incremental
+'''
+
+from typing import Dict, Iterator, List, Optional
+
+
+def replay(timeline: List[Dict]) -> Iterator[Dict]:
+    """
+    Reconstrói, dia a dia, o estado completo a partir de uma timeline incremental.
+
+    Cada entrada da timeline traz a data, o saldo e apenas as alterações da carteira
+    naquele dia ('opened', 'changed' e 'closed'). Entradas no formato antigo, com a
+    carteira completa em 'portfolio', são repassadas sem alteração.
+
+    :param timeline: Lista de entradas gravadas pelo Runner.
+    :return: Gerador de dicionários com 'date', 'balance' e 'portfolio' (lista de lotes).
+    """
+    lotes: Dict[int, Dict] = {}
+
+    for entry in timeline:
+        if 'portfolio' in entry:
+            # Formato antigo, com o estado completo em cada entrada
+            yield entry
+            continue
+
+        for lote in entry.get('closed', []):
+            lotes.pop(lote, None)
+        for lote, quantidade in entry.get('changed', []):
+            lotes[lote]['quantidade'] = quantidade
+        for item in entry.get('opened', []):
+            item = dict(item)
+            lotes[item.pop('lote')] = item
+
+        yield {
+            'date': entry['date'],
+            'balance': entry['balance'],
+            'portfolio': [dict(item) for item in lotes.values()]
+        }
+
+
+def expand_timeline(timeline: List[Dict]) -> List[Dict]:
+    """
+    Converte uma timeline incremental em estados completos para todos os dias.
+
+    :param timeline: Lista de entradas gravadas pelo Runner.
+    :return: Lista de estados com 'date', 'balance' e 'portfolio'.
+    """
+    return list(replay(timeline))
+
+
+def state_at(timeline: List[Dict], date: str) -> Optional[Dict]:
+    """
+    Reconstrói o estado da carteira em uma data.
+
+    :param timeline: Lista de entradas gravadas pelo Runner.
+    :param date: Data desejada (YYYY-MM-DD).
+    :return: Último estado gravado até a data, ou None se a data for anterior à timeline.
+    """
+    state = None
+    for current in replay(timeline):
+        if current['date'] > date:
+            break
+        state = current
+    return state
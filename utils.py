@@ -1,7 +1,8 @@
 import os
 import json
-import matplotlib.pyplot as plt
+from typing import List
 import numpy as np
+from timeline import replay
 
 
 def convert_numpy(obj):
@@ -22,7 +23,7 @@ def get_safe_int(value):
 
 def generate_filename(prefix, result, start_date, end_date):
     """ Gera o nome do arquivo de forma centralizada """
-    return f'results/{prefix}_profit{get_safe_int(result["profit"])}_loss{get_safe_int(result["loss"])}_div{get_safe_int(result["diversification"])}_short{get_safe_int(result["window"][0])}_long{get_safe_int(result["window"][1])}_{start_date}_to_{end_date}.json'
+    return f'results/{prefix}_profit{get_safe_int(result["profit"])}_loss{get_safe_int(result["loss"])}_div{get_safe_int(result["diversification"])}_short{get_safe_int(result["window"][0])}_long{get_safe_int(result["window"][1])}_{start_date}_to_{end_date}.jsonl'
 
 
 def save_json(filename, data):
@@ -32,43 +33,71 @@ def save_json(filename, data):
         json.dump(data, file, indent=4, default=convert_numpy)
 
 
-def generate_performance_plot(directory: str = "results", output_prefix: str = "performance_comparison"):
+def save_jsonl(filename, records):
+    """ Salva uma lista de registros como JSON delimitado por linha (um registro por linha) """
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'w') as file:
+        for record in records:
+            file.write(json.dumps(record, separators=(',', ':'), default=convert_numpy))
+            file.write('\n')
+
+
+def load_jsonl(filename):
+    """ Carrega um arquivo JSON delimitado por linha """
+    with open(filename, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def generate_performance_plot(directory: str = "results", output_prefix: str = "performance_comparison",
+                              filenames: List[str] = None):
     """
-    Gera um gráfico contendo todas as linhas das simulações a partir dos arquivos JSON na pasta `directory`.
+    Gera um gráfico contendo todas as linhas das simulações a partir dos arquivos de timeline
+    (JSONL) na pasta `directory`. Os arquivos JSON do formato antigo só são usados se
+    forem informados em `filenames`.
 
-    :param directory: Pasta onde os arquivos JSON estão localizados.
+    :param directory: Pasta onde os arquivos de timeline estão localizados.
     :param output_prefix: Prefixo para o nome do arquivo de saída do gráfico.
+    :param filenames: Nomes dos arquivos de timeline a plotar (padrão: todos os .jsonl
+                      de `directory`).
     """
 
+    import matplotlib.pyplot as plt  # pylint: disable=import-outside-toplevel
+
     plt.figure(figsize=(10, 6))
 
-    for filename in os.listdir(directory):
-        if filename.endswith(".json"):
+    if filenames is None:
+        filenames = sorted(name for name in os.listdir(directory) if name.endswith(".jsonl"))
+
+    for filename in filenames:
+        if filename.endswith((".json", ".jsonl")):
             try:
-                with open(os.path.join(directory, filename), "r") as timeline_file:
-                    timeline = json.load(timeline_file)
-
-                    # Extrair parâmetros do nome do arquivo
-                    params = filename.replace(
-                        "timeline_", "").replace(".json", "")
-                    labels = params.split("_")
-                    profit = labels[0].replace("profit", "")
-                    loss = labels[1].replace("loss", "")
-                    div = labels[2].replace("div", "")
-                    short = labels[3].replace("short", "")
-                    long = labels[4].replace("long", "")
-
-                    allocation_over_time = []
-                    for entry in timeline:
-                        allocation = sum(
-                            item['quantidade'] * item['preco_compra'] for item in entry['portfolio']
-                        )
-                        allocation_over_time.append(allocation)
-
-                    interval = range(len(allocation_over_time))
-
-                    plt.plot(interval[2:], allocation_over_time[2:], label=f"Profit={profit}, Loss={loss}, "
-                             f"Div={div}, Short={short}, Long={long}")
+                if filename.endswith(".jsonl"):
+                    timeline = load_jsonl(os.path.join(directory, filename))
+                else:
+                    with open(os.path.join(directory, filename), "r") as timeline_file:
+                        timeline = json.load(timeline_file)
+
+                # Extrair parâmetros do nome do arquivo
+                params = filename.replace(
+                    "timeline_", "").replace(".jsonl", "").replace(".json", "")
+                labels = params.split("_")
+                profit = labels[0].replace("profit", "")
+                loss = labels[1].replace("loss", "")
+                div = labels[2].replace("div", "")
+                short = labels[3].replace("short", "")
+                long = labels[4].replace("long", "")
+
+                allocation_over_time = []
+                for entry in replay(timeline):
+                    allocation = sum(
+                        item['quantidade'] * item['preco_compra'] for item in entry['portfolio']
+                    )
+                    allocation_over_time.append(allocation)
+
+                interval = range(len(allocation_over_time))
+
+                plt.plot(interval[2:], allocation_over_time[2:], label=f"Profit={profit}, Loss={loss}, "
+                         f"Div={div}, Short={short}, Long={long}")
 
             except FileNotFoundError:
                 print(f"Arquivo não encontrado: {filename}")